@@ -0,0 +1,5 @@
+"""Benchmarks for the server internals.
+
+Every module in this package can be run on its own, e.g.
+``python -m syncplay.bench.roomstate``.
+"""
@@ -0,0 +1,146 @@
+"""A headless client speaking the Syncplay protocol, for load generation."""
+import time
+
+from twisted.internet.protocol import ClientFactory
+
+from syncplay.protocols import CommandRegistry, JSONCommandProtocol
+
+BENCH_FEATURES = {"sharedPlaylists": True, "chat": True, "readiness": True, "managedRooms": True}
+
+
+class BenchClientProtocol(JSONCommandProtocol):
+    """Behaves like an idle player: it answers every State the server sends
+    with its own, which is what drives the State round trip on real clients.
+    Everything it sends and receives is accounted in the owning session.
+    """
+    commands = CommandRegistry()
+    # Non-isolated servers answer List with every watcher on the server
+    MAX_LENGTH = 64 * 1024 * 1024
+
+    def __init__(self, session, username: str, roomName: str, leader: bool = False):
+        self._session = session
+        self.commandStats = session.commandStats
+        self.username = username
+        self.roomName = roomName
+        self._leader = leader
+        self.logged = False
+        self.position = 0.0
+        self.playerPaused = True
+        self._positionTime = time.time()
+        self._serverRtt = 0.0
+
+    def showDebugMessage(self, line) -> None:
+        pass
+
+    def dropWithError(self, error) -> None:
+        self._session.clientError(self, error)
+        self.drop()
+
+    def connectionMade(self) -> None:
+        self._session.clientConnected(self)
+        self.sendMessage({"Hello": {
+            "username": self.username,
+            "room": {"name": self.roomName},
+            "version": self._session.version,
+            "features": BENCH_FEATURES,
+        }})
+
+    def connectionLost(self, reason) -> None:
+        self._session.clientLost(self)
+
+    def dataReceived(self, data: bytes) -> None:
+        self._session.bytesReceived += len(data)
+        super().dataReceived(data)
+
+    def sendMessage(self, dict_: dict) -> None:
+        line = self.encodeMessage(dict_)
+        self._session.countSent(next(iter(dict_)), len(line) + 2)
+        self.sendLine(line)
+
+    def currentPosition(self) -> float:
+        if self.playerPaused:
+            return self.position
+        return self.position + time.time() - self._positionTime
+
+    def _setPlaystate(self, position, paused) -> None:
+        self.position = position or 0.0
+        self.playerPaused = bool(paused)
+        self._positionTime = time.time()
+
+    def sendState(self, doSeek: bool = False, serverLatencyCalculation=None, ignoringOnTheFly=None) -> None:
+        ping = {"clientRtt": self._serverRtt, "clientLatencyCalculation": time.time()}
+        if serverLatencyCalculation is not None:
+            ping["latencyCalculation"] = serverLatencyCalculation
+        state = {
+            "playstate": {"position": self.currentPosition(), "paused": self.playerPaused, "doSeek": doSeek},
+            "ping": ping,
+        }
+        if ignoringOnTheFly:
+            state["ignoringOnTheFly"] = ignoringOnTheFly
+        self.sendMessage({"State": state})
+
+    def seek(self, position: float) -> None:
+        self._setPlaystate(position, False)
+        self.sendState(doSeek=True)
+
+    def sendChat(self, message: str) -> None:
+        self.sendMessage({"Chat": message})
+
+    def sendList(self) -> None:
+        self.sendMessage({"List": None})
+
+    @commands.command("Hello", dict)
+    def handleHello(self, hello) -> None:
+        self.logged = True
+        self._session.clientLogged(self)
+        self.sendMessage({"Set": {"file": {"name": "bench.mkv", "duration": 7200.0, "size": 1}}})
+        self.sendMessage({"Set": {"ready": {"isReady": True, "manuallyInitiated": False}}})
+        if self._leader:
+            self._setPlaystate(0.0, False)
+            self.sendState()
+
+    @commands.command("State", dict)
+    def handleState(self, state) -> None:
+        ping = state.get("ping", {})
+        playstate = state.get("playstate")
+        if playstate is not None:
+            self._setPlaystate(playstate.get("position"), playstate.get("paused"))
+        if "serverRtt" in ping:
+            self._serverRtt = ping["serverRtt"] or 0.0
+        if "clientLatencyCalculation" in ping:
+            # The server adds the time it held our timestamp before echoing it
+            self._session.recordStateRtt(time.time() - ping["clientLatencyCalculation"])
+        ignoringOnTheFly = None
+        if "server" in state.get("ignoringOnTheFly", {}):
+            ignoringOnTheFly = {"server": state["ignoringOnTheFly"]["server"]}
+        self.sendState(serverLatencyCalculation=ping.get("latencyCalculation"), ignoringOnTheFly=ignoringOnTheFly)
+
+    @commands.command("Set")
+    def handleSet(self, settings) -> None:
+        pass
+
+    @commands.command("List")
+    def handleList(self, userlist) -> None:
+        pass
+
+    @commands.command("Chat")
+    def handleChat(self, chat) -> None:
+        pass
+
+    @commands.command("Error")
+    def handleError(self, error) -> None:
+        self._session.clientError(self, error)
+
+
+class BenchClientFactory(ClientFactory):
+    def __init__(self, session, username: str, roomName: str, leader: bool = False):
+        self._session = session
+        self._username = username
+        self._roomName = roomName
+        self._leader = leader
+
+    def buildProtocol(self, addr):
+        return BenchClientProtocol(self._session, self._username, self._roomName, self._leader)
+
+    def clientConnectionFailed(self, connector, reason) -> None:
+        self._session.connectionFailed(reason)
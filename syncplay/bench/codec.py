@@ -0,0 +1,40 @@
+"""Speed of the available JSON codecs.
+
+Speed is measured on the messages the server sends and receives most, see
+``syncplay.checks.codec`` for their wire compatibility.
+"""
+import argparse
+import time
+
+from syncplay.checks.codec import SAMPLES
+from syncplay.jsoncodec import availableCodecs, getCodec
+
+
+def measure(codec, rounds: int) -> dict:
+    results = {}
+    for name, message in SAMPLES.items():
+        encoded = codec.dumps(message)
+        started = time.perf_counter()
+        for _ in range(rounds):
+            codec.dumps(message)
+        dumps = time.perf_counter() - started
+        started = time.perf_counter()
+        for _ in range(rounds):
+            codec.loads(encoded)
+        loads = time.perf_counter() - started
+        results[name] = (dumps / rounds * 1e6, loads / rounds * 1e6)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2000)
+    args = parser.parse_args()
+    for name in availableCodecs():
+        print(f"{name}:")
+        for sample, (dumps, loads) in measure(getCodec(name), args.rounds).items():
+            print(f"  {sample:>8}  dumps {dumps:8.2f}us  loads {loads:8.2f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import sys
+
+from twisted.internet.address import IPv4Address
+from twisted.internet.testing import StringTransport
+
+from syncplay.server import SyncFactory
+
+
+class BenchTransport(StringTransport):
+    def write(self, data) -> None:
+        # Nothing reads the output back, so there is no point keeping it
+        pass
+
+    def writeSequence(self, seq) -> None:
+        pass
+
+
+def makeFactory(**kwargs) -> SyncFactory:
+    kwargs.setdefault("salt", "benchmark")
+    # Simulated clients hold no sockets, all come from the same address and none time out
+    kwargs.setdefault("maxConnections", sys.maxsize)
+    kwargs.setdefault("maxConnectionsPerIp", 0)
+    kwargs.setdefault("maxPendingHellos", 0)
+    return SyncFactory(**kwargs)
+
+
+def makeTransport(host: str = "127.0.0.1") -> BenchTransport:
+    return BenchTransport(peerAddress=IPv4Address("TCP", host, 0))
+
+
+def connect(factory: SyncFactory, host: str = "127.0.0.1", transport=None):
+    protocol = factory.buildProtocol(IPv4Address("TCP", host, 0))
+    protocol.makeConnection(transport if transport is not None else makeTransport(host))
+    return protocol
+
+
+def login(factory: SyncFactory, username: str, roomName: str, version: str = "1.6.8", host: str = "127.0.0.1",
+          transport=None):
+    protocol = connect(factory, host, transport)
+    protocol.handleHello({
+        "username": username,
+        "room": {"name": roomName},
+        "version": version,
+        "features": {"sharedPlaylists": True, "chat": True, "readiness": True, "managedRooms": True},
+    })
+    # No reactor runs during benchmarks, so hand queued lines to the transport now
+    factory.flushWrites()
+    return protocol
+
+
+def populateRoom(factory: SyncFactory, roomName: str, size: int, prefix: str = "user") -> list:
+    return [login(factory, f"{prefix}{i}", roomName) for i in range(size)]
+
+
+def watcherOf(protocol):
+    return protocol._watcher
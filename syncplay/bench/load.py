@@ -0,0 +1,337 @@
+"""End-to-end load test of a server over loopback.
+
+Connects a population of headless clients (see ``syncplay.bench.client``)
+spread over rooms whose sizes follow a configurable distribution, keeps them
+playing, chatting, seeking and listing for a while and prints a JSON report
+with server CPU and RSS, message rates and the State round-trip latency seen
+by the clients. Without --port a server is started for the run, and any
+arguments after ``--`` are passed on to it, e.g.
+
+    python -m syncplay.bench.load --watchers 2000 --rooms zipf:1.5:200 -- --isolate-rooms
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from twisted.internet import reactor, task
+
+from syncplay.bench.client import BenchClientFactory
+from syncplay.metrics import CommandStats
+from syncplay.utils import raiseFileDescriptorLimit
+
+ACTIVITY_INTERVAL = 0.1
+
+
+def roomSizes(spec: str, watchers: int, rng: random.Random) -> list:
+    """Split watchers into rooms according to spec.
+
+    fixed:N gives rooms of N watchers, uniform:A-B draws every size between
+    A and B with equal probability and zipf:S[:MAX] draws sizes up to MAX
+    (default: all watchers) with probability proportional to size^-S, which
+    gives the long tail of small rooms and a few crowded ones seen on public
+    servers.
+    """
+    kind, _, params = spec.partition(":")
+    if kind == "fixed":
+        size = int(params)
+        draw = lambda: size
+    elif kind == "uniform":
+        low, _, high = params.partition("-")
+        low, high = int(low), int(high or low)
+        draw = lambda: rng.randint(low, high)
+    elif kind == "zipf":
+        exponent, _, largest = params.partition(":")
+        exponent = float(exponent)
+        candidates = range(1, int(largest or watchers) + 1)
+        weights = [size ** -exponent for size in candidates]
+        draw = lambda: rng.choices(candidates, weights)[0]
+    else:
+        raise ValueError(f"Unknown room size distribution: {spec}")
+
+    sizes = []
+    remaining = watchers
+    while remaining > 0:
+        size = min(max(1, draw()), remaining)
+        sizes.append(size)
+        remaining -= size
+    return sizes
+
+
+def percentile(samples: list, fraction: float):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class ProcessSampler:
+    """Reads CPU time and RSS of a process and its children from /proc."""
+
+    def __init__(self, pid: int):
+        self._pid = pid
+        self._ticks = os.sysconf("SC_CLK_TCK")
+
+    def _pids(self) -> list:
+        pids = [self._pid]
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    fields = f.read().rpartition(")")[2].split()
+            except OSError:
+                continue
+            if int(fields[1]) == self._pid:
+                pids.append(int(entry))
+        return pids
+
+    def sample(self):
+        cpu = 0.0
+        rss = 0
+        for pid in self._pids():
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    fields = f.read().rpartition(")")[2].split()
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            rss += int(line.split()[1]) * 1024
+            except OSError:
+                continue
+            cpu += (int(fields[11]) + int(fields[12])) / self._ticks
+        return cpu, rss
+
+
+class LoadSession:
+    def __init__(self, args):
+        self.args = args
+        self.version = args.client_version
+        self.commandStats = CommandStats()
+        self.sent = {}
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        self.stateRtts = []
+        self.errors = []
+        self.connected = 0
+        self.logged = 0
+        self.failed = 0
+        self.lost = 0
+        self._clients = []
+        self._rng = random.Random(args.seed)
+        self._activity = None
+
+    def countSent(self, command: str, size: int) -> None:
+        self.sent[command] = self.sent.get(command, 0) + 1
+        self.bytesSent += size
+
+    def recordStateRtt(self, rtt: float) -> None:
+        self.stateRtts.append(rtt)
+
+    def clientConnected(self, client) -> None:
+        self.connected += 1
+
+    def clientLogged(self, client) -> None:
+        self.logged += 1
+        self._clients.append(client)
+
+    def clientLost(self, client) -> None:
+        self.lost += 1
+        if client.logged:
+            self._clients.remove(client)
+
+    def clientError(self, client, error) -> None:
+        self.errors.append(str(error))
+
+    def connectionFailed(self, reason) -> None:
+        self.failed += 1
+
+    def connectAll(self, sizes: list) -> None:
+        delay = 0.0
+        step = 1.0 / self.args.connect_rate
+        for roomIndex, size in enumerate(sizes):
+            roomName = f"bench-{roomIndex}"
+            for member in range(size):
+                factory = BenchClientFactory(self, f"w{roomIndex}-{member}", roomName, leader=member == 0)
+                reactor.callLater(delay, reactor.connectTCP, self.args.host, self.args.port, factory)
+                delay += step
+
+    def resetCounters(self) -> None:
+        self.commandStats.reset()
+        self.sent.clear()
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        self.stateRtts = []
+
+    def startActivity(self) -> None:
+        self._activity = task.LoopingCall(self._act)
+        self._activity.start(ACTIVITY_INTERVAL, now=False)
+
+    def stopActivity(self) -> None:
+        if self._activity is not None and self._activity.running:
+            self._activity.stop()
+
+    def _draw(self, ratePerWatcher: float) -> int:
+        expected = ratePerWatcher * len(self._clients) * ACTIVITY_INTERVAL
+        count = int(expected)
+        if self._rng.random() < expected - count:
+            count += 1
+        return count
+
+    def _act(self) -> None:
+        if not self._clients:
+            return
+        for _ in range(self._draw(self.args.chat_rate)):
+            self._rng.choice(self._clients).sendChat("benchmark chat message")
+        for _ in range(self._draw(self.args.seek_rate)):
+            client = self._rng.choice(self._clients)
+            client.seek(max(0.0, client.currentPosition() + self._rng.uniform(-30, 30)))
+        for _ in range(self._draw(self.args.list_rate)):
+            self._rng.choice(self._clients).sendList()
+
+
+def _freePort() -> int:
+    with socket.socket() as skt:
+        skt.bind(("127.0.0.1", 0))
+        return skt.getsockname()[1]
+
+
+def _startServer(port: int, serverArgs: list) -> subprocess.Popen:
+    # All clients connect from loopback at a rate no real server sees
+    command = [
+        sys.executable, "-m", "syncplay", "--port", str(port), "--salt", "benchmark",
+        "--max-connections-per-ip", "0", "--max-pending-hellos", "0",
+    ] + serverArgs
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return server
+        except OSError:
+            time.sleep(0.1)
+    server.terminate()
+    raise RuntimeError("Server did not start listening")
+
+
+def run(args, serverPid=None) -> dict:
+    rng = random.Random(args.seed)
+    sizes = roomSizes(args.rooms, args.watchers, rng)
+    session = LoadSession(args)
+    sampler = ProcessSampler(serverPid) if serverPid and os.path.isdir("/proc") else None
+    report = {}
+    measurement = {}
+
+    def startMeasuring():
+        session.resetCounters()
+        session.startActivity()
+        measurement["started"] = time.perf_counter()
+        if sampler:
+            measurement["cpu"], measurement["rss"] = sampler.sample()
+        reactor.callLater(args.duration, stopMeasuring)
+
+    def stopMeasuring():
+        elapsed = time.perf_counter() - measurement["started"]
+        session.stopActivity()
+        received = session.commandStats.received
+        rtts = [rtt * 1000 for rtt in session.stateRtts]
+        report.update({
+            "watchers": args.watchers,
+            "rooms": len(sizes),
+            "largestRoom": max(sizes),
+            "distribution": args.rooms,
+            "duration": elapsed,
+            "clients": {
+                "connected": session.connected,
+                "logged": session.logged,
+                "failed": session.failed,
+                "lost": session.lost,
+                "errors": len(session.errors),
+            },
+            "messages": {
+                "sent": dict(session.sent),
+                "received": dict(received),
+                "sentPerSec": sum(session.sent.values()) / elapsed,
+                "receivedPerSec": sum(received.values()) / elapsed,
+                "bytesSentPerSec": session.bytesSent / elapsed,
+                "bytesReceivedPerSec": session.bytesReceived / elapsed,
+            },
+            "stateRtt": {
+                "samples": len(rtts),
+                "p50Ms": percentile(rtts, 0.50),
+                "p99Ms": percentile(rtts, 0.99),
+                "maxMs": max(rtts) if rtts else None,
+            },
+        })
+        if sampler:
+            cpu, rss = sampler.sample()
+            report["server"] = {
+                "cpuSeconds": cpu - measurement["cpu"],
+                "cpuPercent": 100 * (cpu - measurement["cpu"]) / elapsed,
+                "rssBytes": rss,
+            }
+        if session.errors:
+            report["firstErrors"] = session.errors[:10]
+        reactor.stop()
+
+    session.connectAll(sizes)
+    rampUp = args.watchers / args.connect_rate
+    reactor.callLater(rampUp + args.settle, startMeasuring)
+    reactor.run()
+    return report
+
+
+def main() -> None:
+    argv = sys.argv[1:]
+    serverArgs = []
+    if "--" in argv:
+        split = argv.index("--")
+        argv, serverArgs = argv[:split], argv[split + 1:]
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="use a running server instead of starting one")
+    parser.add_argument("--server-pid", type=int, help="process to sample CPU and RSS of when using --port")
+    parser.add_argument("--watchers", type=int, default=1000)
+    parser.add_argument("--rooms", default="zipf:1.5:100", help="fixed:N, uniform:A-B or zipf:S[:MAX]")
+    parser.add_argument("--duration", type=float, default=30.0, help="length of the measured window in seconds")
+    parser.add_argument("--connect-rate", type=float, default=500.0, help="new connections per second")
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds to wait after connecting before measuring")
+    parser.add_argument("--chat-rate", type=float, default=0.01, help="chat messages per watcher per second")
+    parser.add_argument("--seek-rate", type=float, default=0.005, help="seeks per watcher per second")
+    parser.add_argument("--list-rate", type=float, default=0.001, help="List requests per watcher per second")
+    parser.add_argument("--client-version", default="1.6.8")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    # Every watcher needs a descriptor here and one in the server, which
+    # inherits the limit when it is started by us
+    raiseFileDescriptorLimit()
+    server = None
+    serverPid = args.server_pid
+    if args.port is None:
+        args.host = "127.0.0.1"
+        args.port = _freePort()
+        server = _startServer(args.port, serverArgs)
+        serverPid = server.pid
+    try:
+        report = run(args, serverPid)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+
+
+if __name__ == "__main__":
+    main()
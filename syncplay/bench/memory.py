@@ -0,0 +1,69 @@
+"""Memory held per idle connection.
+
+Logs in a number of watchers, spread over rooms of a fixed size, and reports
+the memory traced while doing so divided by the number of connections. The
+fake transports are created beforehand, as a real socket's memory is not
+the server's to save. Rooms are isolated, as otherwise every login is
+announced to every connection and the run takes quadratic time. With --top
+the allocation sites holding the most memory are listed too.
+"""
+import argparse
+import gc
+import tracemalloc
+
+from twisted.internet import reactor
+
+from syncplay.bench.fixtures import login, makeFactory, makeTransport
+
+
+def run(counts, roomSize: int, top: int = 0) -> list:
+    results = []
+    for count in counts:
+        factory = makeFactory(isolateRooms=True)
+        transports = [makeTransport() for _ in range(count)]
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        protocols = [
+            login(factory, f"user{i}", f"room{i // roomSize}", transport=transports[i])
+            for i in range(count)
+        ]
+        # Without a running reactor the flush calls cancelled by each login
+        # would otherwise stay queued and be counted
+        reactor.runUntilCurrent()
+        factory.flushWrites()
+        gc.collect()
+        held = tracemalloc.get_traced_memory()[0] - before
+        snapshot = tracemalloc.take_snapshot() if top else None
+        tracemalloc.stop()
+        result = {
+            "connections": count,
+            "roomSize": roomSize,
+            "bytes": held,
+            "bytesPerConnection": held / count,
+        }
+        if snapshot is not None:
+            result["top"] = [
+                (str(stat.traceback[0]), stat.size / count)
+                for stat in snapshot.statistics("lineno")[:top]
+            ]
+        results.append(result)
+        del protocols, transports, factory
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connections", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--room-size", type=int, default=5)
+    parser.add_argument("--top", type=int, default=0, help="list this many allocation sites")
+    args = parser.parse_args()
+    print(f"{'connections':>11} {'room size':>9} {'total MiB':>10} {'bytes/conn':>11}")
+    for r in run(args.connections, args.room_size, args.top):
+        print(f"{r['connections']:>11} {r['roomSize']:>9} {r['bytes'] / 2 ** 20:>10.1f} {r['bytesPerConnection']:>11.0f}")
+        for site, size in r.get("top", []):
+            print(f"    {size:>9.0f}  {site}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Cost of resolving a room's State for every member once per interval.
+
+Compares the per-member lookup the server used to do (``isPaused()``,
+``getPosition()`` and ``setBy`` for each watcher) with the per-turn snapshot
+from ``Room.getStateSnapshot``. The leader is re-elected at the start of each
+interval in both cases, as happens on a live server.
+"""
+import argparse
+import random
+import time
+
+from syncplay.bench.fixtures import makeFactory, populateRoom, watcherOf
+from syncplay.server import Room
+
+
+def _prepareRoom(size: int) -> Room:
+    factory = makeFactory()
+    protocols = populateRoom(factory, "bench", size)
+    for protocol in protocols:
+        watcher = watcherOf(protocol)
+        watcher.setFile({"name": "bench.mkv", "duration": 7200, "size": 1})
+        watcher.setPosition(random.uniform(0, 10))
+    factory.flushWrites()
+    room = watcherOf(protocols[0]).room
+    room.setPaused(Room.STATE_PLAYING)
+    return room
+
+
+def _perMember(room: Room, turn: int) -> None:
+    for _ in room.watchers:
+        room.isPaused(), room.getPosition(), room.setBy
+
+
+def _snapshot(room: Room, turn: int) -> None:
+    for _ in room.watchers:
+        room.getStateSnapshot(turn)
+
+
+def _measure(room: Room, serve, intervals: int) -> float:
+    elapsed = 0.0
+    for turn in range(intervals):
+        room._lastUpdate -= 2  # make the next lookup re-elect the leader
+        started = time.perf_counter()
+        serve(room, turn)
+        elapsed += time.perf_counter() - started
+    return elapsed / intervals
+
+
+def run(sizes, intervals: int) -> list:
+    results = []
+    for size in sizes:
+        room = _prepareRoom(size)
+        perMember = _measure(room, _perMember, intervals)
+        snapshot = _measure(room, _snapshot, intervals)
+        results.append({
+            "watchers": size,
+            "perMemberUs": perMember * 1e6,
+            "snapshotUs": snapshot * 1e6,
+            "speedup": perMember / snapshot if snapshot else float("inf"),
+        })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--intervals", type=int, default=200)
+    args = parser.parse_args()
+    print(f"{'watchers':>8} {'per-member (us)':>16} {'snapshot (us)':>14} {'speedup':>8}")
+    for result in run(args.sizes, args.intervals):
+        print(f"{result['watchers']:>8} {result['perMemberUs']:>16.1f} {result['snapshotUs']:>14.1f} {result['speedup']:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Allocations made by repeated reads of ``Room.watchers``.
+
+Every broadcast, List request and stats snapshot reads the member list of a
+room. This compares building a fresh list on each read (the old behaviour)
+with the cached tuple the room now hands out until its membership changes.
+"""
+import argparse
+import tracemalloc
+
+from syncplay.bench.fixtures import makeFactory, populateRoom, watcherOf
+from syncplay.server import Room
+
+
+def _freshList(room: Room):
+    return list(room._watchers.values())
+
+
+def _cachedTuple(room: Room):
+    return room.watchers
+
+
+def _measure(room: Room, read, reads: int) -> tuple:
+    # Results are kept alive so every allocation shows up in traced memory
+    results = [None] * reads
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(reads):
+        results[i] = read(room)
+    allocated = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return len({id(result) for result in results}), allocated
+
+
+def run(sizes, reads: int) -> list:
+    results = []
+    for size in sizes:
+        factory = makeFactory()
+        room = watcherOf(populateRoom(factory, "bench", size)[0]).room
+        listObjects, listBytes = _measure(room, _freshList, reads)
+        tupleObjects, tupleBytes = _measure(room, _cachedTuple, reads)
+        results.append({
+            "watchers": size,
+            "reads": reads,
+            "listObjects": listObjects,
+            "listBytes": listBytes,
+            "tupleObjects": tupleObjects,
+            "tupleBytes": tupleBytes,
+        })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--reads", type=int, default=1000)
+    args = parser.parse_args()
+    print(f"{'watchers':>8} {'reads':>6} {'list objs':>10} {'list bytes':>11} {'tuple objs':>11} {'tuple bytes':>12}")
+    for r in run(args.sizes, args.reads):
+        print(f"{r['watchers']:>8} {r['reads']:>6} {r['listObjects']:>10} {r['listBytes']:>11} {r['tupleObjects']:>11} {r['tupleBytes']:>12}")
+
+
+if __name__ == "__main__":
+    main()
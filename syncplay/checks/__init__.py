@@ -0,0 +1,5 @@
+"""Pass/fail checks of server behaviour.
+
+Every module in this package can be run on its own, e.g.
+``python -m syncplay.checks.codec``, and exits non-zero when a check fails.
+"""
@@ -0,0 +1,46 @@
+"""Connection limits apply to each address on its own.
+
+One address holding its quota of connections that have not logged in yet
+must not keep other addresses out, and a login frees a pending slot.
+"""
+import sys
+
+from syncplay.metrics import CommandStats, ServerMetrics
+from syncplay.server import AdmissionControl
+
+
+class _Connection:
+    pass
+
+
+def run() -> list:
+    failures = []
+    admission = AdmissionControl(ServerMetrics(CommandStats()), maxConnections=0, maxConnectionsPerIp=0, maxPendingHellos=3)
+    flood = []
+    while admission.admits("192.0.2.1") and len(flood) < 10:
+        flood.append(_Connection())
+        admission.admit(flood[-1], "192.0.2.1")
+    if len(flood) != 3:
+        failures.append(f"one address got {len(flood)} pending connections, the limit is 3")
+    if not admission.admits("192.0.2.2"):
+        failures.append("another address was refused while the first one held its pending connections")
+    admission.helloReceived(flood[0])
+    if not admission.admits("192.0.2.1"):
+        failures.append("logging in did not free a pending connection")
+    for connection in flood:
+        admission.release(connection)
+    if admission.connections or admission._pendingByHost or admission._connectionsByHost:
+        failures.append("released connections are still counted")
+    return failures
+
+
+def main() -> None:
+    failures = run()
+    print("admission: " + ("limits are per address" if not failures else "FAILED"))
+    for failure in failures:
+        print(f"  {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
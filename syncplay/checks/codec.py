@@ -0,0 +1,68 @@
+"""Wire compatibility of the available JSON codecs.
+
+Every codec must produce bytes the standard library parses back to the same
+message, parse the standard library's output back to the same message and
+reject what the standard library rejects.
+"""
+import sys
+
+from syncplay.jsoncodec import StdlibJSONCodec, availableCodecs, getCodec
+
+SAMPLES = {
+    "State": {"State": {
+        "ping": {"latencyCalculation": 1602345678.123456, "serverRtt": 0.0421, "clientLatencyCalculation": 1602345677.9},
+        "playstate": {"position": 1234.5678, "paused": False, "doSeek": False, "setBy": "alice"},
+        "ignoringOnTheFly": {"server": 1},
+    }},
+    "Hello": {"Hello": {
+        "username": "bob", "room": {"name": "movie night"}, "version": "1.2.255", "realversion": "1.6.8",
+        "motd": "Welcome, $username!\nJoin us at https://example.org/", "features": {
+            "isolateRooms": False, "readiness": True, "managedRooms": True, "chat": True,
+            "maxChatMessageLength": 150, "maxUsernameLength": 150, "maxRoomNameLength": 35, "maxFilenameLength": 250,
+        },
+    }},
+    "Chat": {"Chat": {"message": "żółć 🎬 \"quoted\" \\ back\\slash </script>", "username": "Zoë"}},
+    "Set": {"Set": {"user": {"carol": {"room": {"name": "+room:ABCDEF123456"}, "file": {
+        "name": "Film (2019) [1080p].mkv", "duration": 7265.04, "size": 4563218944,
+    }, "event": {"joined": True, "version": "1.6.8", "features": {"chat": True, "readiness": True}}}}}},
+    "playlist": {"Set": {"playlistChange": {"user": "dave", "files": [f"episode {i:03d}.mkv" for i in range(250)]}}},
+    "List": {"List": {f"room{r}": {f"user{u}": {
+        "position": 0, "file": {"name": f"file{u}.mkv", "duration": 1440.0, "size": 123456789},
+        "controller": u == 0, "isReady": bool(u % 2), "features": {"sharedPlaylists": True, "chat": True},
+    } for u in range(10)} for r in range(10)}},
+}
+
+
+def checkParity(codec) -> list:
+    reference = StdlibJSONCodec()
+    failures = []
+    for name, message in SAMPLES.items():
+        if reference.loads(codec.dumps(message)) != message:
+            failures.append(f"{name}: stdlib cannot read {codec.name} output back")
+        if codec.loads(reference.dumps(message)) != message:
+            failures.append(f"{name}: {codec.name} cannot read stdlib output back")
+        if codec.loads(b"  " + reference.dumps(message) + b" \r") != message:
+            failures.append(f"{name}: {codec.name} rejects surrounding whitespace")
+    for bad in (b"\xff\xfe{}", b"{\"Hello\": ", b"not json"):
+        try:
+            codec.loads(bad)
+        except ValueError:
+            pass
+        else:
+            failures.append(f"{codec.name} accepted invalid input {bad!r}")
+    return failures
+
+
+def main() -> None:
+    failed = False
+    for name in availableCodecs():
+        failures = checkParity(getCodec(name))
+        failed = failed or bool(failures)
+        print(f"{name}: {'wire compatible' if not failures else 'NOT wire compatible'}")
+        for failure in failures:
+            print(f"  {failure}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
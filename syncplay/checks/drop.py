@@ -0,0 +1,80 @@
+"""Dropped clients are disconnected even when they stop reading.
+
+A client whose socket buffers are full pauses the server's writes to it. When
+such a client is then dropped, its connection must still close rather than
+wait forever for the client to read.
+"""
+import socket
+import sys
+import time
+
+from twisted.internet import reactor
+
+from syncplay.bench.fixtures import makeFactory
+
+TIMEOUT = 5
+FILLER = b'{"Chat": {"message": "' + b"x" * 4000 + b'", "username": "filler"}}'
+
+
+def _spin(condition, timeout: float = TIMEOUT) -> bool:
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        reactor.iterate(0.01)
+    return condition()
+
+
+def _closedByServer(client: socket.socket) -> bool:
+    # Discard whatever the server managed to send until the connection ends
+    client.settimeout(TIMEOUT)
+    try:
+        while client.recv(65536):
+            pass
+    except socket.timeout:
+        return False
+    except ConnectionError:
+        pass
+    return True
+
+
+def run() -> list:
+    failures = []
+    factory = makeFactory(isolateRooms=True)
+    accepted = []
+    buildProtocol = factory.buildProtocol
+    factory.buildProtocol = lambda addr: accepted.append(buildProtocol(addr)) or accepted[-1]
+    port = reactor.listenTCP(0, factory, interface="127.0.0.1")
+    client = socket.socket()
+    client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    client.connect(("127.0.0.1", port.getHost().port))
+    try:
+        if not _spin(lambda: accepted):
+            return ["the server never accepted the connection"]
+        protocol = accepted[0]
+        # The client never reads, so the server's writes pause eventually
+        while not protocol._writesPaused and protocol.transport.connected:
+            protocol.sendLine(FILLER)
+            reactor.iterate(0.01)
+        if not protocol._writesPaused:
+            return ["the connection closed before writes to it paused"]
+        protocol.dropWithError("check")
+        if not _spin(lambda: protocol.transport.disconnected):
+            failures.append(f"a paused connection was still open {TIMEOUT} seconds after being dropped")
+        elif not _closedByServer(client):
+            failures.append("the client never saw the connection close")
+    finally:
+        client.close()
+        port.stopListening()
+        _spin(lambda: False, 0.1)
+    return failures
+
+
+def main() -> None:
+    failures = run()
+    print("drop: " + ("paused connections close" if not failures else "FAILED"))
+    for failure in failures:
+        print(f"  {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
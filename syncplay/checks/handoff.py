@@ -0,0 +1,128 @@
+"""Commands sent along with a room switch survive a handoff between workers.
+
+Starts a server with several workers and has a client switch to a room owned
+by another worker in the same Set as a new file. The file must reach the
+members of the new room under the client's own name, a List must show the
+rooms of every worker and no worker may log an error. A second client asking
+for the same name on the other worker must be given a different one.
+"""
+import argparse
+import json
+import socket
+import subprocess
+import sys
+import time
+
+from syncplay.workers import roomOwner
+
+FEATURES = {"sharedPlaylists": True, "chat": True, "readiness": True, "managedRooms": True}
+
+
+class LineClient:
+    def __init__(self, port: int, username: str, roomName: str):
+        self._socket = socket.create_connection(("127.0.0.1", port))
+        self._socket.settimeout(0.2)
+        self._buffer = b""
+        self.messages = []
+        self.send({"Hello": {"username": username, "room": {"name": roomName}, "version": "1.6.8", "features": FEATURES}})
+
+    def send(self, message: dict) -> None:
+        self._socket.sendall(json.dumps(message).encode('utf-8') + b"\r\n")
+
+    def receive(self, seconds: float) -> list:
+        deadline = time.time() + seconds
+        while time.time() < deadline:
+            try:
+                data = self._socket.recv(65536)
+            except socket.timeout:
+                continue
+            if not data:
+                break
+            self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\r\n")
+        self.messages.extend(json.loads(line) for line in lines if line.strip())
+        return self.messages
+
+    def close(self) -> None:
+        self._socket.close()
+
+
+def freePort() -> int:
+    with socket.socket() as skt:
+        skt.bind(("127.0.0.1", 0))
+        return skt.getsockname()[1]
+
+
+def roomsOnDifferentWorkers(workers: int) -> tuple:
+    owner = roomOwner("handoff-from", workers)
+    for i in range(1000):
+        roomName = f"handoff-to-{i}"
+        if roomOwner(roomName, workers) != owner:
+            return "handoff-from", roomName
+    raise RuntimeError("No room owned by another worker")
+
+
+def run(workers: int) -> list:
+    port = freePort()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "syncplay", "--port", str(port), "--salt", "check", "--workers", str(workers)],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+    )
+    failures = []
+    try:
+        deadline = time.time() + 15
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+                break
+            except OSError:
+                if time.time() > deadline or server.poll() is not None:
+                    raise RuntimeError("Server did not start listening")
+                time.sleep(0.1)
+        origin, target = roomsOnDifferentWorkers(workers)
+        member = LineClient(port, "member", target)
+        member.receive(0.5)
+        stayer = LineClient(port, "stayer", origin)
+        stayer.receive(0.5)
+        mover = LineClient(port, "mover", origin)
+        mover.receive(0.5)
+        namesake = LineClient(port, "mover", target)
+        hellos = [m["Hello"] for m in namesake.receive(0.5) if "Hello" in m]
+        if not hellos or hellos[0]["username"].lower() == "mover":
+            failures.append("a name in use on one worker was given out again by another")
+        file_ = {"name": "moved.mkv", "duration": 60.0, "size": 1234}
+        mover.send({"Set": {"room": {"name": target}, "file": file_}})
+        mover.receive(1)
+        users = [m["Set"]["user"] for m in member.receive(1) if "user" in m.get("Set", {})]
+        if not any(user.get("mover", {}).get("file") == file_ for user in users):
+            failures.append(f"{target} did not hear about the file set with the room switch")
+        mover.send({"List": None})
+        rooms = [m["List"] for m in mover.receive(1) if "List" in m]
+        if not rooms or rooms[-1].get(target, {}).get("mover", {}).get("file") != file_:
+            failures.append("the new room's list does not show the file")
+        if not rooms or "stayer" not in rooms[-1].get(origin, {}):
+            failures.append("the list does not show the rooms of other workers")
+        for client in (member, stayer, mover, namesake):
+            client.close()
+    finally:
+        server.terminate()
+        output = server.communicate(timeout=15)[0].decode('utf-8', 'replace')
+    for line in output.splitlines():
+        if "Traceback" in line or line.startswith("ERROR"):
+            failures.append(f"server logged: {line}")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=3)
+    args = parser.parse_args()
+    failures = run(args.workers)
+    for failure in failures:
+        print(failure)
+    print("handoff: " + ("FAILED" if failures else "OK"))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
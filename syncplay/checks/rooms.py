@@ -0,0 +1,55 @@
+"""Members of a room learn the file of whoever joins it.
+
+A watcher switching rooms keeps its file, and the members of the room it
+moves to must know about it, whichever room manager the server runs.
+"""
+import sys
+
+from twisted.internet.address import IPv4Address
+from twisted.internet.testing import StringTransport
+
+from syncplay.bench.fixtures import login, makeFactory, watcherOf
+from syncplay.jsoncodec import StdlibJSONCodec
+
+FILE = {"name": "check.mkv", "duration": 60.0, "size": 1}
+MODES = {
+    "public": {},
+    "interest routing": {"interestRouting": True},
+    "isolated": {"isolateRooms": True},
+}
+
+
+def _receivedFile(transport: StringTransport, username: str) -> bool:
+    codec = StdlibJSONCodec()
+    for line in transport.value().split(b"\r\n"):
+        user = codec.loads(line).get("Set", {}).get("user", {}) if line else {}
+        if user.get(username, {}).get("file") == FILE:
+            return True
+    return False
+
+
+def run() -> list:
+    failures = []
+    for mode, options in MODES.items():
+        factory = makeFactory(**options)
+        member = StringTransport(peerAddress=IPv4Address("TCP", "127.0.0.1", 0))
+        login(factory, "member", "destination", transport=member)
+        mover = watcherOf(login(factory, "mover", "origin"))
+        mover.setFile(dict(FILE))
+        factory.setWatcherRoom(mover, "destination")
+        factory.flushWrites()
+        if not _receivedFile(member, "mover"):
+            failures.append(f"{mode}: the new room was not told the mover's file")
+    return failures
+
+
+def main() -> None:
+    failures = run()
+    print("rooms: " + ("room switches announce the file" if not failures else "FAILED"))
+    for failure in failures:
+        print(f"  {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Room State is resolved once per scheduler turn.
+
+Members of one room are spread over the slots of the State timing wheel, but
+the room's position must still be worked out only once per interval, and the
+shared result must keep moving while the room plays.
+"""
+import sys
+
+from twisted.internet import task
+
+from syncplay import constants
+from syncplay.bench.fixtures import makeFactory, populateRoom, watcherOf
+from syncplay.scheduler import StateScheduler
+from syncplay.server import Room
+
+MEMBERS = 50
+INTERVALS = 5
+
+
+def run() -> list:
+    failures = []
+    factory = makeFactory(isolateRooms=True)
+    watchers = [watcherOf(protocol) for protocol in populateRoom(factory, "check", MEMBERS)]
+    room = watchers[0].room
+    room.setPaused(Room.STATE_PLAYING)
+    factory.flushWrites()
+
+    clock = task.Clock()
+    scheduler = StateScheduler(factory._sendScheduledState, clock=clock)
+    for watcher in watchers:
+        scheduler.schedule(watcher)
+    slotsUsed = len({scheduler._slotOf[watcher] for watcher in watchers})
+    if slotsUsed < 2:
+        failures.append(f"members landed in {slotsUsed} slot, the check needs several")
+
+    computed = []
+    getPosition = Room.getPosition
+
+    def countingGetPosition(self):
+        computed.append(clock.seconds())
+        return getPosition(self)
+
+    Room.getPosition = countingGetPosition
+    try:
+        scheduler.start()
+        for _ in range(INTERVALS * constants.SERVER_STATE_WHEEL_SLOTS):
+            clock.advance(scheduler.tickInterval)
+            factory.flushWrites()
+    finally:
+        Room.getPosition = getPosition
+        scheduler.stop()
+
+    if len(computed) != INTERVALS:
+        failures.append(f"room state computed {len(computed)} times over {INTERVALS} intervals")
+    return failures
+
+
+def main() -> None:
+    failures = run()
+    print("snapshot: " + ("once per interval" if not failures else "FAILED"))
+    for failure in failures:
+        print(f"  {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
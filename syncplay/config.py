@@ -4,6 +4,7 @@ import sys
 
 
 from syncplay import constants
+from syncplay.jsoncodec import CODEC_NAMES
 from syncplay.messages import getMessage
 
 
@@ -16,9 +17,15 @@ class ConfigGetter:
         if args.isolate_rooms is False:
             tmp = os.environ.get('SYNCPLAY_ISOLATE_ROOMS', '').lower()
             args.isolate_rooms = (tmp == 'true')
+        if args.interest_routing is False:
+            tmp = os.environ.get('SYNCPLAY_INTEREST_ROUTING', '').lower()
+            args.interest_routing = (tmp == 'true')
         if args.disable_ready is False:
             tmp = os.environ.get('SYNCPLAY_DISABLE_READY', '').lower()
             args.disable_ready = (tmp == 'true')
+        if args.disable_rate_limits is False:
+            tmp = os.environ.get('SYNCPLAY_DISABLE_RATE_LIMITS', '').lower()
+            args.disable_rate_limits = (tmp == 'true')
         if args.disable_chat is False:
             tmp = os.environ.get('SYNCPLAY_DISABLE_CHAT', '').lower()
             args.disable_chat = (tmp == 'true')
@@ -35,6 +42,8 @@ class ConfigGetter:
             args.stats_db_file = os.environ.get('SYNCPLAY_STATS_DB_FILE')
         if args.tls is None:
             args.tls = os.environ.get('SYNCPLAY_TLS_PATH')
+        if args.json_codec is None:
+            args.json_codec = os.environ.get('SYNCPLAY_JSON_CODEC', 'auto')
 
         if args.max_chat_message_length is None:
             tmp = os.environ.get('SYNCPLAY_MAX_CHAT_MSG_LEN')
@@ -48,6 +57,48 @@ class ConfigGetter:
                 args.max_username_length = int(tmp)
             else:
                 args.max_username_length = constants.MAX_USERNAME_LENGTH
+        if args.max_connections is None:
+            tmp = os.environ.get('SYNCPLAY_MAX_CONNECTIONS')
+            if tmp is not None and tmp.isdigit():
+                args.max_connections = int(tmp)
+            else:
+                args.max_connections = constants.MAX_CONNECTIONS
+        if args.max_connections_per_ip is None:
+            tmp = os.environ.get('SYNCPLAY_MAX_CONNECTIONS_PER_IP')
+            if tmp is not None and tmp.isdigit():
+                args.max_connections_per_ip = int(tmp)
+            else:
+                args.max_connections_per_ip = constants.MAX_CONNECTIONS_PER_IP
+        if args.max_pending_hellos is None:
+            tmp = os.environ.get('SYNCPLAY_MAX_PENDING_HELLOS')
+            if tmp is not None and tmp.isdigit():
+                args.max_pending_hellos = int(tmp)
+            else:
+                args.max_pending_hellos = constants.MAX_PENDING_HELLOS
+        if args.workers is None:
+            tmp = os.environ.get('SYNCPLAY_WORKERS')
+            if tmp is not None and tmp.isdigit():
+                args.workers = int(tmp)
+            else:
+                args.workers = 1
+        if args.metrics_port is None:
+            tmp = os.environ.get('SYNCPLAY_METRICS_PORT')
+            if tmp is not None and tmp.isdigit():
+                args.metrics_port = int(tmp)
+        if args.stats_retention_days is None:
+            tmp = os.environ.get('SYNCPLAY_STATS_RETENTION_DAYS')
+            if tmp is not None and tmp.isdigit():
+                args.stats_retention_days = int(tmp)
+            else:
+                args.stats_retention_days = constants.STATS_RAW_RETENTION_DAYS
+        if args.stats_hourly_retention_days is None:
+            tmp = os.environ.get('SYNCPLAY_STATS_HOURLY_RETENTION_DAYS')
+            if tmp is not None and tmp.isdigit():
+                args.stats_hourly_retention_days = int(tmp)
+            else:
+                args.stats_hourly_retention_days = constants.STATS_HOURLY_RETENTION_DAYS
+        if args.metrics_interface is None:
+            args.metrics_interface = os.environ.get('SYNCPLAY_METRICS_INTERFACE', constants.DEFAULT_METRICS_INTERFACE)
 
         return args
 
@@ -60,12 +111,23 @@ class ConfigGetter:
         argparser.add_argument('--port', metavar='port', type=str, nargs='?', help=getMessage("server-port-argument"))
         argparser.add_argument('--password', metavar='password', type=str, nargs='?', help=getMessage("server-password-argument"))
         argparser.add_argument('--isolate-rooms', action='store_true', help=getMessage("server-isolate-room-argument"))
+        argparser.add_argument('--interest-routing', action='store_true', help=getMessage("server-interest-routing-argument"))
         argparser.add_argument('--disable-ready', action='store_true', help=getMessage("server-disable-ready-argument"))
         argparser.add_argument('--disable-chat', action='store_true', help=getMessage("server-chat-argument"))
+        argparser.add_argument('--disable-rate-limits', action='store_true', help=getMessage("server-disable-rate-limits-argument"))
         argparser.add_argument('--salt', metavar='salt', type=str, nargs='?', help=getMessage("server-salt-argument"))
         argparser.add_argument('--motd-file', metavar='file', type=str, nargs='?', help=getMessage("server-motd-argument"))
         argparser.add_argument('--max-chat-message-length', metavar='maxChatMessageLength', type=int, nargs='?', help=getMessage("server-chat-maxchars-argument").format(constants.MAX_CHAT_MESSAGE_LENGTH))
         argparser.add_argument('--max-username-length', metavar='maxUsernameLength', type=int, nargs='?', help=getMessage("server-maxusernamelength-argument").format(constants.MAX_USERNAME_LENGTH))
         argparser.add_argument('--stats-db-file', metavar='file', type=str, nargs='?', help=getMessage("server-stats-db-file-argument"))
+        argparser.add_argument('--stats-retention-days', metavar='days', type=int, nargs='?', help=getMessage("server-stats-retention-argument").format(constants.STATS_RAW_RETENTION_DAYS))
+        argparser.add_argument('--stats-hourly-retention-days', metavar='days', type=int, nargs='?', help=getMessage("server-stats-hourly-retention-argument").format(constants.STATS_HOURLY_RETENTION_DAYS))
+        argparser.add_argument('--max-connections', metavar='connections', type=int, nargs='?', help=getMessage("server-max-connections-argument"))
+        argparser.add_argument('--max-connections-per-ip', metavar='connections', type=int, nargs='?', help=getMessage("server-max-connections-per-ip-argument").format(constants.MAX_CONNECTIONS_PER_IP))
+        argparser.add_argument('--max-pending-hellos', metavar='connections', type=int, nargs='?', help=getMessage("server-max-pending-hellos-argument").format(constants.MAX_PENDING_HELLOS, constants.HELLO_TIMEOUT))
         argparser.add_argument('--tls', metavar='path', type=str, nargs='?', help=getMessage("server-startTLS-argument"))
+        argparser.add_argument('--json-codec', metavar='codec', type=str, nargs='?', choices=CODEC_NAMES, help=getMessage("server-json-codec-argument").format(', '.join(CODEC_NAMES)))
+        argparser.add_argument('--workers', metavar='workers', type=int, nargs='?', help=getMessage("server-workers-argument"))
+        argparser.add_argument('--metrics-port', metavar='port', type=int, nargs='?', help=getMessage("server-metrics-port-argument"))
+        argparser.add_argument('--metrics-interface', metavar='address', type=str, nargs='?', help=getMessage("server-metrics-interface-argument").format(constants.DEFAULT_METRICS_INTERFACE))
         return argparser
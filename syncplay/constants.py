@@ -2,14 +2,50 @@
 
 # You might want to change these
 DEFAULT_PORT = 8999
+LISTEN_BACKLOG = 1024  # Capped by the kernel (net.core.somaxconn)
+MAX_CONNECTIONS = 0  # 0 allows as many as the open file limit leaves room for
+MAX_CONNECTIONS_PER_IP = 0  # 0 is unlimited
+MAX_PENDING_HELLOS = 512  # Connections from one address yet to send Hello; 0 is unlimited
+DEFAULT_METRICS_INTERFACE = "127.0.0.1"
 RECENT_CLIENT_THRESHOLD = "1.6.7"  # This and higher considered 'recent' clients (no warnings)
 WARN_OLD_CLIENTS = True  # Use MOTD to inform old clients to upgrade
 FALLBACK_INITIAL_LANGUAGE = "en"
 
 # Changing these might be ok
 PROTOCOL_TIMEOUT = 12.5
+HELLO_TIMEOUT = 15  # Seconds a new connection has to log in, STARTTLS included
+IDLE_REAPER_RESOLUTION = 1  # Seconds; timeouts fire up to this much late
+IDLE_REAPER_SLOTS = 32  # Slots of the idle timeout wheel; longer deadlines wrap around
+RESERVED_FILE_DESCRIPTORS = 64  # Kept free of clients for listening sockets, the stats database, workers...
+WORKER_STOP_TIMEOUT = 1  # Seconds a stopping worker waits for the others to learn it is stopping
+WORKER_LIST_TIMEOUT = 1  # Seconds a List waits for the rooms of the other workers
 SERVER_STATE_INTERVAL = 1
+SERVER_STATE_WHEEL_SLOTS = 10  # State sends are spread across this many ticks per interval
 SERVER_STATS_SNAPSHOT_INTERVAL = 3600
+MOTD_CHECK_INTERVAL = 5  # Seconds between checks of the MOTD file for changes
+MOTD_CACHE_SIZE = 1024  # Rendered MOTDs kept for templates without per-user placeholders
+STATS_RAW_RETENTION_DAYS = 31  # Per-client snapshot rows; 0 keeps them forever
+STATS_HOURLY_RETENTION_DAYS = 92  # Hourly rollups; daily rollups are always kept
+STATS_COMPACTION_FREE_RATIO = 0.25  # Vacuum the stats database once this much of it is free pages
+CLIENT_WRITE_BUFFER_THRESHOLD = 64 * 1024  # Queued outgoing bytes before a client counts as slow
+CLIENT_BACKLOG_LIMIT = 1024 * 1024  # Held outgoing bytes before a slow client is disconnected
+ROOM_INTEREST_WINDOW = 60  # Seconds a List request subscribes a client to other rooms' events with interest routing
+# Messages per second and burst allowed per connection, by command; State.seek only counts seeking States
+RATE_LIMITS = {
+    "Chat": (2, 10),
+    "State": (20, 40),
+    "State.seek": (2, 10),
+    "Set.room": (1, 5),
+    "Set.file": (2, 10),
+    "Set.ready": (2, 10),
+    "Set.controllerAuth": (1, 5),
+    "Set.playlistChange": (1, 5),
+    "Set.playlistIndex": (2, 10),
+    "Set.features": (1, 5),
+    "List": (1, 5),
+}
+RATE_LIMIT_MAX_VIOLATIONS = 50  # Rate limited messages within the window below before a client is disconnected
+RATE_LIMIT_VIOLATION_WINDOW = 10
 PLAYLIST_MAX_CHARACTERS = 10000
 PLAYLIST_MAX_ITEMS = 250
 
@@ -27,10 +63,26 @@ SHARED_PLAYLIST_MIN_VERSION = "1.4.0"
 CHAT_MIN_VERSION = "1.5.0"
 FEATURE_LIST_MIN_VERSION = "1.5.0"
 
+# Capability bits worked out once from each client's version
+CAPABILITY_CONTROLLED_ROOMS = 1
+CAPABILITY_USER_READY = 2
+CAPABILITY_SHARED_PLAYLIST = 4
+CAPABILITY_CHAT = 8
+CAPABILITY_RECENT_CLIENT = 16
+CAPABILITY_MIN_VERSIONS = {
+    CAPABILITY_CONTROLLED_ROOMS: CONTROLLED_ROOMS_MIN_VERSION,
+    CAPABILITY_USER_READY: USER_READY_MIN_VERSION,
+    CAPABILITY_SHARED_PLAYLIST: SHARED_PLAYLIST_MIN_VERSION,
+    CAPABILITY_CHAT: CHAT_MIN_VERSION,
+    CAPABILITY_RECENT_CLIENT: RECENT_CLIENT_THRESHOLD,
+}
+CLIENT_PROFILE_CACHE_SIZE = 256  # Distinct versions and feature sets whose objects connections share
+
 # Changing these is usually not something you're looking for
 PING_MOVING_AVERAGE_WEIGHT = 0.85
 
 TLS_CERT_ROTATION_MAX_RETRIES = 10
+TLS_CERT_CHECK_INTERVAL = 60  # Seconds between checks of the certificate files for renewals
 
 # Note: Constants updated in client.py->checkForFeatureSupport
 SERVER_MAX_TEMPLATE_LENGTH = 10000
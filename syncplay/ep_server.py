@@ -1,15 +1,36 @@
 import logging
+import signal
+import sys
 
-from twisted.internet import reactor
-
-from twisted.internet.endpoints import TCP4ServerEndpoint, TCP6ServerEndpoint
-
+from syncplay import constants
 from syncplay.config import ConfigGetter
-from syncplay.server import SyncFactory
+from syncplay.utils import raiseFileDescriptorLimit
 
 
 def main():
+    if sys.argv[1:2] == ["stats"]:
+        from syncplay import statsdb
+        statsdb.main(sys.argv[2:])
+        return
+
     args = ConfigGetter.getConfig()
+    # Workers inherit the limit
+    raiseFileDescriptorLimit()
+
+    if args.workers > 1:
+        # Twisted is only imported after forking, so each worker installs
+        # its own reactor
+        from syncplay.workers import runWorkers
+        runWorkers(args, serve)
+    else:
+        serve(args)
+
+
+def serve(args, workerNode=None):
+    from twisted.internet import reactor
+    from twisted.internet.endpoints import TCP4ServerEndpoint, TCP6ServerEndpoint
+
+    from syncplay.server import SyncFactory
 
     factory = SyncFactory(
         args.port,
@@ -22,10 +43,35 @@ def main():
         args.max_chat_message_length,
         args.max_username_length,
         args.stats_db_file,
-        args.tls
+        args.tls,
+        args.json_codec,
+        args.stats_retention_days,
+        args.stats_hourly_retention_days,
+        args.interest_routing,
+        args.disable_rate_limits,
+        args.max_connections,
+        args.max_connections_per_ip,
+        args.max_pending_hellos
     )
 
-    endpoint6 = TCP6ServerEndpoint(reactor, int(args.port))
+    if hasattr(signal, "SIGUSR1"):
+        # Handlers may run at any point, so leave the actual work to the reactor
+        signal.signal(signal.SIGUSR1, lambda signum, frame: reactor.callFromThread(factory.toggleProfiling))
+        signal.signal(signal.SIGUSR2, lambda signum, frame: reactor.callFromThread(factory.logProfile))
+
+    if args.metrics_port is not None:
+        from twisted.web.server import Site
+        from syncplay.metrics import MetricsResource
+        # Every worker serves its own counters on consecutive ports
+        metricsPort = args.metrics_port + (workerNode.index if workerNode is not None else 0)
+        reactor.listenTCP(metricsPort, Site(MetricsResource(factory.metrics)), interface=args.metrics_interface)
+
+    if workerNode is not None:
+        workerNode.listen(factory, int(args.port))
+        reactor.run()
+        return
+
+    endpoint6 = TCP6ServerEndpoint(reactor, int(args.port), backlog=constants.LISTEN_BACKLOG)
 
     def failed6(e):
         logging.debug(e)
@@ -33,7 +79,7 @@ def main():
 
     endpoint6.listen(factory).addErrback(failed6)
 
-    endpoint4 = TCP4ServerEndpoint(reactor, int(args.port))
+    endpoint4 = TCP4ServerEndpoint(reactor, int(args.port), backlog=constants.LISTEN_BACKLOG)
 
     def failed4(e):
         logging.debug(e)
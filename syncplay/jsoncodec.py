@@ -0,0 +1,70 @@
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+# Codecs parse straight from the received bytes and produce the bytes that go
+# on the wire, so no intermediate str is built in either direction.
+# Decoding errors are ValueError subclasses (UnicodeDecodeError for bad UTF-8
+# where the library tells them apart).
+
+class StdlibJSONCodec:
+    name = "stdlib"
+
+    def loads(self, data: bytes):
+        return json.loads(data)
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+
+
+class OrjsonCodec:
+    name = "orjson"
+
+    def loads(self, data: bytes):
+        return orjson.loads(data)
+
+    def dumps(self, obj) -> bytes:
+        return orjson.dumps(obj)
+
+
+class UjsonCodec:
+    name = "ujson"
+
+    def loads(self, data: bytes):
+        return ujson.loads(data)
+
+    def dumps(self, obj) -> bytes:
+        return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+
+
+CODECS = {
+    "orjson": OrjsonCodec if orjson is not None else None,
+    "ujson": UjsonCodec if ujson is not None else None,
+    "stdlib": StdlibJSONCodec,
+}
+CODEC_NAMES = ["auto"] + list(CODECS)
+
+
+def availableCodecs() -> list:
+    return [name for name, codec in CODECS.items() if codec is not None]
+
+
+def getCodec(name: str = "auto"):
+    if name in (None, "auto"):
+        return CODECS[availableCodecs()[0]]()
+    if name not in CODECS:
+        raise ValueError(f"Unknown JSON codec '{name}'")
+    if CODECS[name] is None:
+        logging.warning(f"JSON codec '{name}' is not installed, falling back to the standard library.")
+        return StdlibJSONCodec()
+    return CODECS[name]()
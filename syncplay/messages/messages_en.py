@@ -459,20 +459,47 @@ en = {
     "server-port-argument": 'server TCP port',
     "server-password-argument": 'server password',
     "server-isolate-room-argument": 'should rooms be isolated?',
+    "server-disable-rate-limits-argument": "disable the per-client message rate limits",
     "server-salt-argument": "random string used to generate managed room passwords",
+    "server-interest-routing-argument": "only send events from other rooms to users who list them (non-isolated rooms)",
     "server-disable-ready-argument": "disable readiness feature",
     "server-motd-argument": "path to file from which motd will be fetched",
     "server-chat-argument": "Should chat be disabled?",
     "server-chat-maxchars-argument": "Maximum number of characters in a chat message (default is {})", # Default number of characters
     "server-maxusernamelength-argument": "Maximum number of characters in a username (default is {})",
     "server-stats-db-file-argument": "Enable server stats using the SQLite db file provided",
+    "server-max-connections-argument": "maximum number of concurrent connections, 0 for as many as the open file limit allows",
+    "server-max-connections-per-ip-argument": "maximum number of concurrent connections from one address, 0 for unlimited (default: {})",
+    "server-max-pending-hellos-argument": "maximum number of connections from one address yet to log in, which get {1} seconds to do so; 0 for unlimited (default: {0})",
     "server-startTLS-argument": "Enable TLS connections using the certificate files in the path provided",
+    "server-workers-argument": "Number of server processes to run; rooms are spread across them (default is 1)",
+    "server-json-codec-argument": "JSON library used for the protocol: {} (default is auto, the fastest one installed)",
+    "server-metrics-port-argument": "Port of an HTTP listener serving OpenMetrics counters; worker N of --workers uses this port plus N (disabled by default)",
+    "server-metrics-interface-argument": "Address the metrics listener binds to (default is {})",
+    "server-profiling-enabled-notification": "Handler profiling enabled, send SIGUSR2 for a report and SIGUSR1 again to stop",
+    "server-profiling-disabled-notification": "Handler profiling disabled",
+    "server-profiling-report-notification": "Most expensive handlers and broadcast sites:\n{}",
+    "server-stats-retention-argument": "Days to keep per-client rows in the stats database, 0 keeps them forever (default is {})",
+    "server-stats-hourly-retention-argument": "Days to keep hourly rollups in the stats database, 0 keeps them forever; daily rollups are always kept (default is {})",
+    "server-stats-description": "Query and maintain the server stats database",
+    "server-stats-json-argument": "Print results as JSON",
+    "server-stats-versions-argument": "Average and peak clients per version",
+    "server-stats-concurrency-argument": "Average and peak concurrent clients per day",
+    "server-stats-days-argument": "Number of days to look back (default is 30)",
+    "server-stats-hourly-argument": "Show every hour still kept instead of daily figures",
+    "server-stats-maintain-argument": "Apply retention and compact the database now",
+    "server-stats-no-database-error": "No stats database found, pass --stats-db-file or set SYNCPLAY_STATS_DB_FILE",
     "server-messed-up-motd-unescaped-placeholders": "Message of the Day has unescaped placeholders. All $ signs should be doubled ($$).",
     "server-messed-up-motd-too-long": "Message of the Day is too long - maximum of {} chars, {} given.",
 
     # Server errors
     "unknown-command-server-error": "Unknown command {}",  # message
     "not-json-server-error": "Not a json encoded string {}",  # message
+    "malformed-command-server-error": "Malformed {} command",  # command
+    "rate-limit-server-error": "Too many {} messages",
+    "rate-limited-server-notification": "Rate limiting {} messages from {}",  # command, host
+    "slow-client-server-error": "Client stopped reading, more than {} bytes of messages were waiting for it",  # bytes
+    "username-taken-server-error": "The name {} was taken while switching rooms, please reconnect",  # username
     "line-decode-server-error": "Not a utf-8 string",
     "not-known-server-error": "You must be known to server before sending this command",
     "client-drop-server-error": "Client drop: {} -- {}",  # host, error
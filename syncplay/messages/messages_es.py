@@ -459,20 +459,47 @@ es = {
     "server-port-argument": 'puerto TCP del servidor',
     "server-password-argument": 'contraseña del servidor',
     "server-isolate-room-argument": '¿las salas deberían estar aisladas?',
+    "server-disable-rate-limits-argument": "disable the per-client message rate limits",  # TODO: Translate
     "server-salt-argument": "cadena aleatoria utilizada para generar contraseñas de salas administradas",
+    "server-interest-routing-argument": "only send events from other rooms to users who list them (non-isolated rooms)",  # TODO: Translate
     "server-disable-ready-argument": "deshabilitar la función de preparación",
     "server-motd-argument": "ruta al archivo del cual se obtendrá el texto motd",
     "server-chat-argument": "¿Debería deshabilitarse el chat?",
     "server-chat-maxchars-argument": "Número máximo de caracteres en un mensaje de chat (el valor predeterminado es {})", # Default number of characters
     "server-maxusernamelength-argument": "Número máximo de caracteres para el nombre de usuario (el valor predeterminado es {})",
     "server-stats-db-file-argument": "Habilitar estadísticas del servidor utilizando el archivo db SQLite proporcionado",
+    "server-max-connections-argument": "maximum number of concurrent connections, 0 for as many as the open file limit allows",  # TODO: Translate
+    "server-max-connections-per-ip-argument": "maximum number of concurrent connections from one address, 0 for unlimited (default: {})",  # TODO: Translate
+    "server-max-pending-hellos-argument": "maximum number of connections from one address yet to log in, which get {1} seconds to do so; 0 for unlimited (default: {0})",  # TODO: Translate
     "server-startTLS-argument": "Habilitar conexiones TLS usando los archivos de certificado en la ruta provista",
+    "server-workers-argument": "Number of server processes to run; rooms are spread across them (default is 1)",  # TODO: Translate
+    "server-json-codec-argument": "JSON library used for the protocol: {} (default is auto, the fastest one installed)",  # TODO: Translate
+    "server-metrics-port-argument": "Port of an HTTP listener serving OpenMetrics counters; worker N of --workers uses this port plus N (disabled by default)",  # TODO: Translate
+    "server-metrics-interface-argument": "Address the metrics listener binds to (default is {})",  # TODO: Translate
+    "server-profiling-enabled-notification": "Handler profiling enabled, send SIGUSR2 for a report and SIGUSR1 again to stop",  # TODO: Translate
+    "server-profiling-disabled-notification": "Handler profiling disabled",  # TODO: Translate
+    "server-profiling-report-notification": "Most expensive handlers and broadcast sites:\n{}",  # TODO: Translate
+    "server-stats-retention-argument": "Days to keep per-client rows in the stats database, 0 keeps them forever (default is {})",  # TODO: Translate
+    "server-stats-hourly-retention-argument": "Days to keep hourly rollups in the stats database, 0 keeps them forever; daily rollups are always kept (default is {})",  # TODO: Translate
+    "server-stats-description": "Query and maintain the server stats database",  # TODO: Translate
+    "server-stats-json-argument": "Print results as JSON",  # TODO: Translate
+    "server-stats-versions-argument": "Average and peak clients per version",  # TODO: Translate
+    "server-stats-concurrency-argument": "Average and peak concurrent clients per day",  # TODO: Translate
+    "server-stats-days-argument": "Number of days to look back (default is 30)",  # TODO: Translate
+    "server-stats-hourly-argument": "Show every hour still kept instead of daily figures",  # TODO: Translate
+    "server-stats-maintain-argument": "Apply retention and compact the database now",  # TODO: Translate
+    "server-stats-no-database-error": "No stats database found, pass --stats-db-file or set SYNCPLAY_STATS_DB_FILE",  # TODO: Translate
     "server-messed-up-motd-unescaped-placeholders": "El mensaje del dia contiene marcadores de posición sin escapar. Todos los signos $ deberían ser dobles ($$).",
     "server-messed-up-motd-too-long": "El mensaje del día es muy largo - máximo de {} caracteres, se recibieron {}.",
 
     # Server errors
     "unknown-command-server-error": "Comando desconocido {}",  # message
     "not-json-server-error": "No es una cadena JSON válida {}",  # message
+    "malformed-command-server-error": "Malformed {} command",  # command  # TODO: Translate
+    "rate-limit-server-error": "Too many {} messages",  # TODO: Translate
+    "rate-limited-server-notification": "Rate limiting {} messages from {}",  # TODO: Translate
+    "slow-client-server-error": "Client stopped reading, more than {} bytes of messages were waiting for it",  # bytes  # TODO: Translate
+    "username-taken-server-error": "The name {} was taken while switching rooms, please reconnect",  # TODO: Translate
     "line-decode-server-error": "No es una cadena utf-8",
     "not-known-server-error": "Debes ser reconocido por el servidor antes de enviar este comando",
     "client-drop-server-error": "Caída del cliente: {} -- {}",  # host, error
@@ -459,20 +459,47 @@ it = {
     "server-port-argument": 'Porta TCP del server',
     "server-password-argument": 'password del server',
     "server-isolate-room-argument": 'Mantiene le stanze isolate',
+    "server-disable-rate-limits-argument": "disable the per-client message rate limits",  # TODO: Translate
     "server-salt-argument": "usare stringhe casuali per generare le password delle stanze gestite",
+    "server-interest-routing-argument": "only send events from other rooms to users who list them (non-isolated rooms)",  # TODO: Translate
     "server-disable-ready-argument": "disabilita la funzionalità \"pronto\"",
     "server-motd-argument": "percorso del file da cui verrà letto il messaggio del giorno",
     "server-chat-argument": "abilita o disabilita la chat",
     "server-chat-maxchars-argument": "Numero massimo di caratteri in un messaggio di chat (default è {})", # Default number of characters
     "server-maxusernamelength-argument": "Numero massimo di caratteri in un nome utente (default è {})",
     "server-stats-db-file-argument": "Abilita la raccolta dei dati statistici nel file SQLite indicato",
+    "server-max-connections-argument": "maximum number of concurrent connections, 0 for as many as the open file limit allows",  # TODO: Translate
+    "server-max-connections-per-ip-argument": "maximum number of concurrent connections from one address, 0 for unlimited (default: {})",  # TODO: Translate
+    "server-max-pending-hellos-argument": "maximum number of connections from one address yet to log in, which get {1} seconds to do so; 0 for unlimited (default: {0})",  # TODO: Translate
     "server-startTLS-argument": "Abilita il protocollo TLS usando i certificati contenuti nel percorso indicato",
+    "server-workers-argument": "Number of server processes to run; rooms are spread across them (default is 1)",  # TODO: Translate
+    "server-json-codec-argument": "JSON library used for the protocol: {} (default is auto, the fastest one installed)",  # TODO: Translate
+    "server-metrics-port-argument": "Port of an HTTP listener serving OpenMetrics counters; worker N of --workers uses this port plus N (disabled by default)",  # TODO: Translate
+    "server-metrics-interface-argument": "Address the metrics listener binds to (default is {})",  # TODO: Translate
+    "server-profiling-enabled-notification": "Handler profiling enabled, send SIGUSR2 for a report and SIGUSR1 again to stop",  # TODO: Translate
+    "server-profiling-disabled-notification": "Handler profiling disabled",  # TODO: Translate
+    "server-profiling-report-notification": "Most expensive handlers and broadcast sites:\n{}",  # TODO: Translate
+    "server-stats-retention-argument": "Days to keep per-client rows in the stats database, 0 keeps them forever (default is {})",  # TODO: Translate
+    "server-stats-hourly-retention-argument": "Days to keep hourly rollups in the stats database, 0 keeps them forever; daily rollups are always kept (default is {})",  # TODO: Translate
+    "server-stats-description": "Query and maintain the server stats database",  # TODO: Translate
+    "server-stats-json-argument": "Print results as JSON",  # TODO: Translate
+    "server-stats-versions-argument": "Average and peak clients per version",  # TODO: Translate
+    "server-stats-concurrency-argument": "Average and peak concurrent clients per day",  # TODO: Translate
+    "server-stats-days-argument": "Number of days to look back (default is 30)",  # TODO: Translate
+    "server-stats-hourly-argument": "Show every hour still kept instead of daily figures",  # TODO: Translate
+    "server-stats-maintain-argument": "Apply retention and compact the database now",  # TODO: Translate
+    "server-stats-no-database-error": "No stats database found, pass --stats-db-file or set SYNCPLAY_STATS_DB_FILE",  # TODO: Translate
     "server-messed-up-motd-unescaped-placeholders": "Il messaggio del giorno ha dei caratteri non 'escaped'. Tutti i simboli $ devono essere doppi ($$).",
     "server-messed-up-motd-too-long": "Il messaggio del giorno è troppo lungo - numero massimo di caratteri è {}, {} trovati.",
 
     # Server errors
     "unknown-command-server-error": "Comando non riconosciuto {}",  # message
     "not-json-server-error": "Non è una stringa in codifica JSON {}",  # message
+    "malformed-command-server-error": "Malformed {} command",  # command  # TODO: Translate
+    "rate-limit-server-error": "Too many {} messages",  # TODO: Translate
+    "rate-limited-server-notification": "Rate limiting {} messages from {}",  # TODO: Translate
+    "slow-client-server-error": "Client stopped reading, more than {} bytes of messages were waiting for it",  # bytes  # TODO: Translate
+    "username-taken-server-error": "The name {} was taken while switching rooms, please reconnect",  # TODO: Translate
     "line-decode-server-error": "Non è una stringa utf-8",
     "not-known-server-error": "Devi essere autenticato dal server prima di poter inviare questo comando",
     "client-drop-server-error": "Il client è caduto: {} -- {}",  # host, error
@@ -0,0 +1,317 @@
+import bisect
+import functools
+import time
+
+from twisted.web.resource import Resource
+
+OPENMETRICS_CONTENT_TYPE = b"application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+FANOUT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+STATE_SEND_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+ROOM_SIZE_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 500)
+TIMING_BUCKETS = (
+    0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+
+def commandOf(line: bytes) -> str:
+    # Name of the single top-level command of an encoded message, b'{"Set": ...'
+    end = line.find(b'"', 2)
+    return line[2:end].decode('ascii', 'replace') if end > 2 else "unknown"
+
+
+class CommandStats:
+    """Per-command counters for the protocol dispatcher.
+
+    Counting is always on; timing each handler costs two clock reads per
+    message, so it is only done while `timing` is set (see HandlerProfiler).
+    """
+
+    def __init__(self):
+        self.timing = False
+        self.received = {}
+        self.receivedBytes = {}
+        self.rejected = {}
+        self.rateLimited = {}
+        self.elapsed = {}
+        # Command names come from clients, so unknown ones share one counter
+        self.unknown = 0
+
+    def countReceived(self, name: str, size: int = 0) -> None:
+        self.received[name] = self.received.get(name, 0) + 1
+        if size:
+            self.receivedBytes[name] = self.receivedBytes.get(name, 0) + size
+
+    def countRejected(self, name: str) -> None:
+        self.rejected[name] = self.rejected.get(name, 0) + 1
+
+    def countRateLimited(self, name: str) -> None:
+        self.rateLimited[name] = self.rateLimited.get(name, 0) + 1
+
+    def countUnknown(self) -> None:
+        self.unknown += 1
+
+    def addElapsed(self, name: str, started: float) -> None:
+        histogram = self.elapsed.get(name)
+        if histogram is None:
+            histogram = self.elapsed[name] = Histogram(TIMING_BUCKETS)
+        histogram.observe(time.perf_counter() - started)
+
+    def reset(self) -> None:
+        self.received.clear()
+        self.receivedBytes.clear()
+        self.rejected.clear()
+        self.rateLimited.clear()
+        self.elapsed.clear()
+        self.unknown = 0
+
+    def getStats(self) -> dict:
+        return {
+            "received": dict(self.received),
+            "receivedBytes": dict(self.receivedBytes),
+            "rejected": dict(self.rejected),
+            "rateLimited": dict(self.rateLimited),
+            "unknown": self.unknown,
+            "elapsed": {name: histogram.sum for name, histogram in self.elapsed.items()},
+        }
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction: float):
+        # Upper bound of the bucket holding the given fraction of samples
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float("inf")
+
+    def render(self, name: str, labels: str = "", header: bool = True) -> list:
+        lines = [f"# TYPE {name} histogram"] if header else []
+        prefix = labels + "," if labels else ""
+        labels = "{" + labels + "}" if labels else ""
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {self.count}')
+        lines.append(f"{name}_count{labels} {self.count}")
+        lines.append(f"{name}_sum{labels} {self.sum}")
+        return lines
+
+
+def _roomSizeLabels() -> tuple:
+    labels = []
+    lower = 1
+    for bound in ROOM_SIZE_BOUNDS:
+        labels.append(str(bound) if bound == lower else f"{lower}-{bound}")
+        lower = bound + 1
+    labels.append(f"{lower}+")
+    return tuple(labels)
+
+
+class ServerMetrics:
+    """Server-wide counters, kept up to date as events happen so that a
+    scrape only formats numbers and never walks the rooms.
+    """
+    _roomSizeLabels = _roomSizeLabels()
+
+    def __init__(self, commandStats: CommandStats):
+        self.commandStats = commandStats
+        self.connections = 0
+        self.connectionsOpened = 0
+        self.watchers = 0
+        self.roomsBySize = [0] * len(self._roomSizeLabels)
+        self.sent = {}
+        self.sentBytes = {}
+        self.tlsUpgrades = 0
+        self.tlsRefused = 0
+        self.flushes = 0
+        self.flushedLines = 0
+        self.writesPaused = 0
+        self.statesCollapsed = 0
+        self.slowClientsDropped = 0
+        self.rateLimitDisconnects = 0
+        self.connectionsRefused = {}
+        self.pendingHellos = 0
+        self.helloTimeouts = 0
+        self.idleTimeouts = 0
+        self.statsSnapshotFailures = 0
+        self.fanout = Histogram(FANOUT_BUCKETS)
+        self.stateSendSeconds = Histogram(STATE_SEND_BUCKETS)
+
+    def connectionOpened(self) -> None:
+        self.connections += 1
+        self.connectionsOpened += 1
+
+    def connectionClosed(self) -> None:
+        self.connections -= 1
+
+    def countRefused(self, reason: str) -> None:
+        self.connectionsRefused[reason] = self.connectionsRefused.get(reason, 0) + 1
+
+    def roomResized(self, oldSize: int, newSize: int) -> None:
+        if oldSize:
+            self.roomsBySize[bisect.bisect_left(ROOM_SIZE_BOUNDS, oldSize)] -= 1
+        if newSize:
+            self.roomsBySize[bisect.bisect_left(ROOM_SIZE_BOUNDS, newSize)] += 1
+        self.watchers += newSize - oldSize
+
+    def countSent(self, command: str, size: int, receivers: int = 1) -> None:
+        self.sent[command] = self.sent.get(command, 0) + receivers
+        self.sentBytes[command] = self.sentBytes.get(command, 0) + size * receivers
+
+    def countBroadcast(self, line: bytes, receivers: int) -> None:
+        self.fanout.observe(receivers)
+        if receivers:
+            self.countSent(commandOf(line), len(line) + 2, receivers)
+
+    def countFlush(self, lines: int) -> None:
+        self.flushes += 1
+        self.flushedLines += lines
+
+    def render(self) -> bytes:
+        stats = self.commandStats
+        lines = []
+
+        def metric(name, kind, value, extra=""):
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name}{extra} {value}")
+
+        def family(name, kind, values, label):
+            lines.append(f"# TYPE {name} {kind}")
+            suffix = "_total" if kind == "counter" else ""
+            if isinstance(values, dict):
+                values = sorted(values.items())
+            for key, value in values:
+                lines.append(f'{name}{suffix}{{{label}="{key}"}} {value}')
+
+        metric("syncplay_connections", "gauge", self.connections)
+        metric("syncplay_connections_opened", "counter", self.connectionsOpened, "_total")
+        family("syncplay_connections_refused", "counter", self.connectionsRefused, "reason")
+        metric("syncplay_pending_hellos", "gauge", self.pendingHellos)
+        metric("syncplay_hello_timeouts", "counter", self.helloTimeouts, "_total")
+        metric("syncplay_idle_timeouts", "counter", self.idleTimeouts, "_total")
+        metric("syncplay_watchers", "gauge", self.watchers)
+        family("syncplay_rooms", "gauge", zip(self._roomSizeLabels, self.roomsBySize), "size")
+        family("syncplay_messages_received", "counter", stats.received, "command")
+        family("syncplay_received_bytes", "counter", stats.receivedBytes, "command")
+        family("syncplay_messages_rejected", "counter", stats.rejected, "command")
+        family("syncplay_messages_rate_limited", "counter", stats.rateLimited, "command")
+        metric("syncplay_rate_limit_disconnects", "counter", self.rateLimitDisconnects, "_total")
+        metric("syncplay_messages_unknown", "counter", stats.unknown, "_total")
+        family("syncplay_messages_sent", "counter", self.sent, "command")
+        family("syncplay_sent_bytes", "counter", self.sentBytes, "command")
+        metric("syncplay_write_flushes", "counter", self.flushes, "_total")
+        metric("syncplay_written_lines", "counter", self.flushedLines, "_total")
+        metric("syncplay_writes_paused", "counter", self.writesPaused, "_total")
+        metric("syncplay_states_collapsed", "counter", self.statesCollapsed, "_total")
+        metric("syncplay_slow_clients_dropped", "counter", self.slowClientsDropped, "_total")
+        metric("syncplay_stats_snapshot_failures", "counter", self.statsSnapshotFailures, "_total")
+        lines.extend(self.fanout.render("syncplay_broadcast_fanout"))
+        lines.extend(self.stateSendSeconds.render("syncplay_state_send_seconds"))
+        if stats.elapsed:
+            lines.append("# TYPE syncplay_handler_seconds histogram")
+            for name, histogram in sorted(stats.elapsed.items()):
+                lines.extend(histogram.render("syncplay_handler_seconds", f'command="{name}"', header=False))
+        family("syncplay_tls_upgrades", "counter", {"accepted": self.tlsUpgrades, "refused": self.tlsRefused}, "result")
+        lines.append("# EOF")
+        return ("\n".join(lines) + "\n").encode('utf-8')
+
+
+class MetricsResource(Resource):
+    isLeaf = True
+
+    def __init__(self, metrics: ServerMetrics):
+        super().__init__()
+        self._metrics = metrics
+
+    def render_GET(self, request) -> bytes:
+        request.setHeader(b"Content-Type", OPENMETRICS_CONTENT_TYPE)
+        return self._metrics.render()
+
+
+class HandlerProfiler:
+    """Wall-time histograms for protocol handlers and factory broadcast sites.
+
+    While disabled nothing is wrapped and the dispatcher skips its clock
+    reads. Enabling it wraps the named factory methods on the instance,
+    so the measured times are inclusive of whatever the method calls.
+    """
+
+    def __init__(self, commandStats: CommandStats, target, sites):
+        self._commandStats = commandStats
+        self._target = target
+        self._sites = tuple(sites)
+        self._label = type(target).__name__
+        self.sites = {}
+        self.enabled = False
+
+    def enable(self) -> None:
+        if self.enabled:
+            return
+        # Every profiling session starts from scratch
+        self.reset()
+        for site in self._sites:
+            setattr(self._target, site, self._wrap(site, getattr(self._target, site)))
+        self._commandStats.timing = True
+        self.enabled = True
+
+    def disable(self) -> None:
+        if not self.enabled:
+            return
+        for site in self._sites:
+            delattr(self._target, site)
+        self._commandStats.timing = False
+        self.enabled = False
+
+    def toggle(self) -> bool:
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+        return self.enabled
+
+    def reset(self) -> None:
+        self.sites.clear()
+        self._commandStats.elapsed.clear()
+
+    def _wrap(self, site: str, method):
+        histogram = self.sites[f"{self._label}.{site}"] = Histogram(TIMING_BUCKETS)
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+        return timed
+
+    def report(self, limit: int = 25) -> str:
+        entries = list(self._commandStats.elapsed.items()) + list(self.sites.items())
+        entries = [entry for entry in entries if entry[1].count]
+        entries.sort(key=lambda entry: entry[1].sum, reverse=True)
+        lines = [f"{'handler':<40} {'calls':>9} {'total ms':>10} {'mean us':>9} {'p50 us':>8} {'p99 us':>8}"]
+        for name, histogram in entries[:limit]:
+            lines.append(
+                f"{name:<40} {histogram.count:>9} {histogram.sum * 1e3:>10.1f} "
+                f"{histogram.sum / histogram.count * 1e6:>9.1f} "
+                f"{histogram.quantile(0.5) * 1e6:>8.1f} {histogram.quantile(0.99) * 1e6:>8.1f}"
+            )
+        return "\n".join(lines)
@@ -1,81 +1,229 @@
 # coding:utf8
-import json
 import time
 from typing import Union
 from functools import wraps
 import logging
 
+from twisted.internet.interfaces import IPushProducer
 from twisted.protocols.basic import LineReceiver
+from zope.interface import implementer
 
 import syncplay
-from syncplay.constants import PING_MOVING_AVERAGE_WEIGHT, CONTROLLED_ROOMS_MIN_VERSION, USER_READY_MIN_VERSION, SHARED_PLAYLIST_MIN_VERSION, CHAT_MIN_VERSION
+from syncplay.constants import PING_MOVING_AVERAGE_WEIGHT, \
+    CLIENT_WRITE_BUFFER_THRESHOLD, CLIENT_BACKLOG_LIMIT, RATE_LIMIT_MAX_VIOLATIONS, RATE_LIMIT_VIOLATION_WINDOW, \
+    HELLO_TIMEOUT, PROTOCOL_TIMEOUT
+from syncplay.jsoncodec import StdlibJSONCodec
 from syncplay.messages import getMessage
-from syncplay.utils import meetsMinVersion
+from syncplay.metrics import CommandStats
+from syncplay.utils import getClientProfile, internFeatures
+
+
+def compileSchema(schema):
+    """Turn a declarative message schema into a validating function.
+
+    None accepts anything, a type or tuple of types is an isinstance check,
+    a one-element list is a list whose items all match that element and a
+    dict is a dict whose keys match the given schemas. Keys ending in "?"
+    are optional; other keys the schema does not name are ignored.
+    """
+    if schema is None:
+        return lambda value: True
+    if isinstance(schema, (type, tuple)):
+        return lambda value: isinstance(value, schema)
+    if isinstance(schema, list):
+        checkItem = compileSchema(schema[0])
+        return lambda value: isinstance(value, list) and all(checkItem(item) for item in value)
+    if isinstance(schema, dict):
+        fields = tuple(
+            (key.rstrip("?"), not key.endswith("?"), compileSchema(subschema))
+            for key, subschema in schema.items()
+        )
+
+        def validate(value) -> bool:
+            if not isinstance(value, dict):
+                return False
+            for key, required, check in fields:
+                if key in value:
+                    if not check(value[key]):
+                        return False
+                elif required:
+                    return False
+            return True
+        return validate
+    raise TypeError(f"Unsupported schema: {schema!r}")
+
+
+class CommandRegistry:
+    """Maps command names to their handlers and precompiled validators."""
+
+    def __init__(self, prefix: str = ""):
+        self._prefix = prefix
+        self._commands = {}
+
+    def command(self, name: str, schema=None):
+        validate = compileSchema(schema)
+
+        def register(handler):
+            self._commands[name] = (handler, validate, self._prefix + name)
+            return handler
+        return register
+
+    def get(self, name: str):
+        return self._commands.get(name)
+
+    def names(self):
+        return [label for _, _, label in self._commands.values()]
+
+
+class TokenBuckets:
+    """Per-connection token buckets for rate limited commands.
+
+    limits maps a command name, as counted by the dispatcher, to the number
+    of messages per second it refills at and the burst it can hold.
+    """
+    __slots__ = ("_limits", "_buckets")
+
+    def __init__(self, limits: dict):
+        self._limits = limits
+        self._buckets = {}
+
+    def allow(self, name: str) -> bool:
+        limit = self._limits.get(name)
+        if limit is None:
+            return True
+        rate, burst = limit
+        now = time.monotonic()
+        bucket = self._buckets.get(name)
+        tokens = burst if bucket is None else min(burst, bucket[0] + (now - bucket[1]) * rate)
+        if tokens < 1:
+            self._buckets[name] = (tokens, now)
+            return False
+        self._buckets[name] = (tokens - 1, now)
+        return True
 
 
 class JSONCommandProtocol(LineReceiver):
-    def handleMessages(self, messages: dict) -> None:
-        for command, message in messages.items():
-            if command == "Hello":
-                self.handleHello(message)
-            elif command == "Set":
-                self.handleSet(message)
-            elif command == "List":
-                self.handleList(message)
-            elif command == "State":
-                self.handleState(message)
-            elif command == "Error":
-                self.handleError(message)
-            elif command == "Chat":
-                self.handleChat(message)
-            elif command == "TLS":
-                self.handleTLS(message)
-            else:
-                # TODO: log, not drop
-                self.dropWithError(getMessage("unknown-command-server-error").format(message))
+    codec = StdlibJSONCodec()
+    commands = CommandRegistry()
+    commandStats = CommandStats()
+    rateLimiter = None
+    _handoff = None
+
+    def handleMessages(self, messages: dict, size: int = 0) -> None:
+        if not isinstance(messages, dict):
+            self.dropWithError(getMessage("malformed-command-server-error").format(type(messages).__name__))
+            return
+        if len(messages) > 1:
+            size //= len(messages)
+        messages = iter(messages.items())
+        for command, message in messages:
+            self.dispatch(self.commands, command, message, size)
+            if self._handoff is not None:
+                # The connection now belongs to another worker, which gets
+                # whatever is left of the line along with it
+                self._handoff[2].update(messages)
+                self.completeHandoff()
+                return
+
+    def dispatch(self, registry: CommandRegistry, command: str, message, size: int = 0) -> None:
+        entry = registry.get(command)
+        stats = self.commandStats
+        if entry is None:
+            stats.countUnknown()
+            logging.debug(getMessage("unknown-command-server-error").format(command))
+            return
+        handler, validate, name = entry
+        if self.rateLimiter is not None and not self.rateLimiter.allow(name):
+            self.rateLimited(name)
+            return
+        if not validate(message):
+            stats.countRejected(name)
+            self.dropWithError(getMessage("malformed-command-server-error").format(name))
+            return
+        stats.countReceived(name, size)
+        if stats.timing:
+            started = time.perf_counter()
+            handler(self, message)
+            stats.addElapsed(name, started)
+        else:
+            handler(self, message)
 
     def lineReceived(self, line: bytes) -> None:
+        if not line or line.isspace():
+            return
+        self.showDebugMessage(f"client/server << {line}")
         try:
-            line = line.decode('utf-8').strip()
+            messages = self.codec.loads(line)
         except UnicodeDecodeError:
             self.dropWithError(getMessage("line-decode-server-error"))
             return
-        if not line:
-            return
-        self.showDebugMessage(f"client/server << {line}")
-        try:
-            messages = json.loads(line)
-        except json.decoder.JSONDecodeError:
-            self.dropWithError(getMessage("not-json-server-error").format(line))
+        except ValueError:
+            self.dropWithError(getMessage("not-json-server-error").format(line.decode('utf-8', 'replace')))
             return
         else:
-            self.handleMessages(messages)
+            self.handleMessages(messages, len(line) + len(self.delimiter))
+
+    def encodeMessage(self, dict_: dict) -> bytes:
+        return self.codec.dumps(dict_)
 
     def sendMessage(self, dict_: dict) -> None:
-        line = json.dumps(dict_)
-        self.sendLine(line.encode('utf-8'))
+        line = self.encodeMessage(dict_)
+        self.sendLine(line)
         self.showDebugMessage(f"client/server >> {line}")
 
+    def sendEncodedMessage(self, line: bytes) -> None:
+        # Used by broadcasts, which encode a message once for all receivers
+        self.sendLine(line)
+
     def drop(self):
         self.transport.loseConnection()
 
     def dropWithError(self, error):
         raise NotImplementedError()
 
+    def rateLimited(self, name: str) -> None:
+        self.commandStats.countRateLimited(name)
+
+    def completeHandoff(self) -> None:
+        raise NotImplementedError()
+
 
 def requireLogged(f):
     @wraps(f)
     def wrapper(self, *args, **kwds):
         if not self._logged:
             self.dropWithError(getMessage("not-known-server-error"))
+            return
         return f(self, *args, **kwds)
     return wrapper
 
 
+_NUMBER = (int, float)
+_OPTIONAL_NUMBER = (int, float, type(None))
+_OPTIONAL_BOOL = (bool, type(None))
+_OPTIONAL_STR = (str, type(None))
+
+
+@implementer(IPushProducer)
 class SyncServerProtocol(JSONCommandProtocol):
+    commands = CommandRegistry()
+    setCommands = CommandRegistry("Set.")
+    # Twisted's base classes still give every instance a __dict__, which
+    # only ends up holding what they set themselves, such as the transport
+    __slots__ = (
+        "_factory", "codec", "commandStats", "_metrics", "_profile", "_features", "_logged",
+        "clientIgnoringOnTheFly", "serverIgnoringOnTheFly", "_pingService", "_clientLatencyCalculation",
+        "_clientLatencyCalculationArrivalTime", "_watcher", "_peerHost", "_relay", "_outbox", "_outboxSize",
+        "_writesPaused", "_queuedState", "_queuedStateSeek", "rateLimiter", "_violations", "_violationsSince",
+        "_connectedAt", "_handoff",
+    )
+
     def __init__(self, factory):
         self._factory = factory
-        self._version = None
+        self.codec = factory.codec
+        self.commandStats = factory.commandStats
+        self._metrics = factory.metrics
+        self._profile = None
         self._features = None
         self._logged = False
         self.clientIgnoringOnTheFly = 0
@@ -84,43 +232,194 @@ class SyncServerProtocol(JSONCommandProtocol):
         self._clientLatencyCalculation = 0
         self._clientLatencyCalculationArrivalTime = 0
         self._watcher = None
+        self._peerHost = None
+        self._relay = None
+        self._outbox = []
+        self._outboxSize = 0
+        self._writesPaused = False
+        self._queuedState = None
+        self._queuedStateSeek = False
+        self.rateLimiter = TokenBuckets(factory.rateLimits) if factory.rateLimits else None
+        self._violations = 0
+        self._violationsSince = 0
+        self._connectedAt = time.time()
+        self._handoff = None
 
     def __hash__(self) -> int:
         return hash('|'.join((
-            self.transport.getPeer().host,
+            self.getPeerHost(),
             str(id(self)),
         )))
 
+    def getPeerHost(self) -> str:
+        # Connections handed over by another worker keep the client's address
+        if self._peerHost is not None:
+            return self._peerHost
+        return self.transport.getPeer().host
+
     def showDebugMessage(self, line) -> None:
         pass
 
+    def sendMessage(self, dict_: dict) -> None:
+        line = self.encodeMessage(dict_)
+        self.sendLine(line)
+        self._metrics.countSent(next(iter(dict_)), len(line) + len(self.delimiter))
+
+    def sendLine(self, line: bytes) -> None:
+        # Everything sent to a client during one reactor iteration leaves in
+        # a single write, and so a single syscall or TLS record
+        if not self._outbox and not self._writesPaused:
+            self._factory.scheduleFlush(self)
+        self._outbox.append(line)
+        self._outbox.append(self.delimiter)
+        self._outboxSize += len(line) + len(self.delimiter)
+        if self._writesPaused and self._outboxSize > CLIENT_BACKLOG_LIMIT:
+            self._dropSlowClient()
+
+    def _sendStateLine(self, line: bytes, doSeek: bool) -> None:
+        # While the client is not reading, a State still waiting in the
+        # queue is dropped in favour of the newer one rather than piling up.
+        # The newer one goes to the end, after whatever was queued since.
+        # Seeks are kept, as later States do not repeat them.
+        if self._queuedState is not None and not self._queuedStateSeek:
+            index = self._queuedState
+            self._outboxSize -= len(self._outbox[index]) + len(self._outbox[index + 1])
+            del self._outbox[index:index + 2]
+            self._metrics.statesCollapsed += 1
+            self._queuedState = None
+        if self._writesPaused or self._queuedState is not None:
+            self._queuedState = len(self._outbox)
+        self.sendLine(line)
+        self._queuedStateSeek = doSeek
+
+    def flush(self, force: bool = False) -> None:
+        if self._outbox and (force or not self._writesPaused):
+            outbox, self._outbox = self._outbox, []
+            self._outboxSize = 0
+            self._queuedState = None
+            self._metrics.countFlush(len(outbox) // 2)
+            self.transport.writeSequence(outbox)
+
+    def drop(self) -> None:
+        # A paused producer would be asked to resume rather than the socket
+        # closed, and a client that is not reading may never drain the buffer
+        self.flush(force=True)
+        if self._writesPaused:
+            self.transport.abortConnection()
+            return
+        self.transport.unregisterProducer()
+        self.transport.loseConnection()
+
+    def _dropSlowClient(self) -> None:
+        logging.warning(getMessage("client-drop-server-error").format(
+            self.getPeerHost(), getMessage("slow-client-server-error").format(CLIENT_BACKLOG_LIMIT)))
+        self._metrics.slowClientsDropped += 1
+        self._outbox = []
+        self._outboxSize = 0
+        self._queuedState = None
+        self.transport.abortConnection()
+
+    def idleDeadline(self):
+        # When the idle reaper drops this connection; None once another
+        # worker serves the client
+        if self._watcher is not None:
+            return self._watcher.lastUpdatedOn + PROTOCOL_TIMEOUT
+        if self._logged or self._relay is not None:
+            return None
+        return self._connectedAt + HELLO_TIMEOUT
+
+    def idleTimedOut(self) -> None:
+        if self._watcher is None:
+            self._metrics.helloTimeouts += 1
+            self.transport.abortConnection()
+            return
+        self._metrics.idleTimeouts += 1
+        self._factory.removeWatcher(self._watcher)
+        self.drop()
+
+    def rateLimited(self, name: str) -> None:
+        # Excess messages are dropped before they reach the room; clients
+        # that keep it up are disconnected
+        self.commandStats.countRateLimited(name)
+        now = time.monotonic()
+        if now - self._violationsSince > RATE_LIMIT_VIOLATION_WINDOW:
+            self._violationsSince = now
+            self._violations = 0
+        self._violations += 1
+        if self._violations == 1:
+            logging.info(getMessage("rate-limited-server-notification").format(name, self.getPeerHost()))
+        elif self._violations > RATE_LIMIT_MAX_VIOLATIONS:
+            self._metrics.rateLimitDisconnects += 1
+            self.dropWithError(getMessage("rate-limit-server-error").format(name))
+
+    def pauseProducing(self) -> None:
+        # The transport buffer is full, so keep further output here
+        self._writesPaused = True
+        self._metrics.writesPaused += 1
+        if self._relay is not None:
+            self._relay.pauseProducing()
+
+    def resumeProducing(self) -> None:
+        self._writesPaused = False
+        if self._relay is not None:
+            self._relay.resumeProducing()
+        if self._outbox:
+            self._factory.scheduleFlush(self)
+
+    def stopProducing(self) -> None:
+        self._writesPaused = True
+
     def dropWithError(self, error) -> None:
-        logging.error(getMessage("client-drop-server-error").format(self.transport.getPeer().host, error))
+        logging.error(getMessage("client-drop-server-error").format(self.getPeerHost(), error))
         self.sendError(error)
         self.drop()
 
+    def connectionMade(self) -> None:
+        self._metrics.connectionOpened()
+        if hasattr(self.transport, "bufferSize"):
+            self.transport.bufferSize = CLIENT_WRITE_BUFFER_THRESHOLD
+        self.transport.registerProducer(self, True)
+
     def connectionLost(self, reason) -> None:
+        self._metrics.connectionClosed()
+        self._outbox = []
+        self._outboxSize = 0
+        self._queuedState = None
+        if self._relay is not None:
+            self._relay.loseConnection()
+        self._factory.connectionClosed(self)
         self._factory.removeWatcher(self._watcher)
 
+    def handOff(self, link, resume: dict) -> None:
+        # Carried out by the dispatcher once the current command returns, so
+        # the rest of the line can go to the owning worker too
+        self._handoff = (link, resume, {})
+
+    def completeHandoff(self) -> None:
+        link, resume, remaining = self._handoff
+        unhandled = self.encodeMessage(remaining) + self.delimiter if remaining else b""
+        self._factory.completeHandoff(self, link, resume, unhandled)
+
+    def startRelay(self, relayTransport) -> None:
+        # Everything the client sends from now on belongs to another worker
+        self._relay = relayTransport
+        self.flush(force=True)
+        self.setRawMode()
+
+    def rawDataReceived(self, data: bytes) -> None:
+        self._relay.write(data)
+
     def getFeatures(self) -> dict:
-        if not self._features:
-            self._features = {
-                "sharedPlaylists": meetsMinVersion(self._version, SHARED_PLAYLIST_MIN_VERSION),
-                "chat": meetsMinVersion(self._version, CHAT_MIN_VERSION),
-                "featureList": False,
-                "readiness": meetsMinVersion(self._version, USER_READY_MIN_VERSION),
-                "managedRooms": meetsMinVersion(self._version, CONTROLLED_ROOMS_MIN_VERSION)
-            }
-        return self._features
+        return self._features or self._profile.features
 
     def isLogged(self) -> bool:
         return self._logged
 
-    def meetsMinVersion(self, version) -> bool:
-        return self._version >= version
+    def getCapabilities(self) -> int:
+        return self._profile.capabilities
 
     def getVersion(self) -> str:
-        return self._version
+        return self._profile.version if self._profile is not None else None
 
     def _extractHelloArguments(self, hello):
         roomName = None
@@ -148,6 +447,14 @@ class SyncServerProtocol(JSONCommandProtocol):
                 return False
         return True
 
+    @commands.command("Hello", {
+        "username?": str,
+        "password?": _OPTIONAL_STR,
+        "room?": {"name?": str},
+        "version?": str,
+        "realversion?": str,
+        "features?": (dict, type(None)),
+    })
     def handleHello(self, hello) -> None:
         username, serverPassword, roomName, version, features = self._extractHelloArguments(hello)
         if not username or not roomName or not version:
@@ -156,19 +463,39 @@ class SyncServerProtocol(JSONCommandProtocol):
         else:
             if not self._checkPassword(serverPassword):
                 return
-            self._version = version
+            self._factory.helloReceived(self)
+            self._profile = getClientProfile(version)
             self.setFeatures(features)
-            self._factory.addWatcher(self, username, roomName)
+            resume = {"username": username, "room": roomName, "version": version, "features": features}
+            if self._factory.handOffConnection(self, resume):
+                return
+            self._login(username, roomName, version)
+
+    def _login(self, username: str, roomName: str, version: str) -> None:
+        self._factory.addWatcher(self, username, roomName)
+        self._logged = True
+        self.sendHello(version)
+
+    def resumeHandoff(self, resume: dict) -> None:
+        # Picks up a client handed over by another worker, either right
+        # after its Hello or when it switched to a room owned by this worker
+        self._peerHost = resume["host"]
+        self._profile = getClientProfile(resume["version"])
+        self.setFeatures(resume["features"])
+        if resume.get("switch"):
+            self._factory.resumeWatcher(self, resume["username"], resume["room"], resume["file"], resume["ready"])
             self._logged = True
-            self.sendHello(version)
+        else:
+            self._login(resume["username"], resume["room"], resume["version"])
 
+    @commands.command("Chat", str)
     @requireLogged
     def handleChat(self, chatMessage):
         if not self._factory.disableChat:
             self._factory.sendChat(self._watcher, chatMessage)
 
     def setFeatures(self, features):
-        self._features = features
+        self._features = internFeatures(features) if features else None
 
     def sendFeaturesUpdate(self):
         self.sendSet({"features": self.getFeatures()})
@@ -180,7 +507,7 @@ class SyncServerProtocol(JSONCommandProtocol):
         hello = {}
         username = self._watcher.name
         hello["username"] = username
-        userIp = self.transport.getPeer().host
+        userIp = self.getPeerHost()
         room = self._watcher.room
         if room:
             hello["room"] = {"name": room.name}
@@ -190,42 +517,57 @@ class SyncServerProtocol(JSONCommandProtocol):
         hello["features"] = self._factory.getFeatures()
         self.sendMessage({"Hello": hello})
 
+    @commands.command("Set", dict)
     @requireLogged
     def handleSet(self, settings) -> None:
-        for command, setting in settings.items():
-            if command == "room":
-                roomName = setting.get("name")
-                self._factory.setWatcherRoom(self._watcher, roomName)
-            elif command == "file":
-                self._watcher.setFile(setting)
-            elif command == "controllerAuth":
-                password = setting.get("password")
-                room = setting.get("room")
-                self._factory.authRoomController(self._watcher, password, room)
-            elif command == "ready":
-                manual = setting.get('manuallyInitiated', False)
-                self._factory.setReady(self._watcher, setting['isReady'], manuallyInitiated=manual)
-            elif command == "playlistChange":
-                self._factory.setPlaylist(self._watcher, setting['files'])
-            elif command == "playlistIndex":
-                self._factory.setPlaylistIndex(self._watcher, setting['index'])
-            elif command == "features":
-                # TODO: Check
-                self._watcher.setFeatures(setting)
-
-    def sendSet(self, setting) -> None:
-        self.sendMessage({"Set": setting})
-
-    def sendNewControlledRoom(self, roomName: str, password) -> None:
-        self.sendSet({
-            "newControlledRoom": {
-                "password": password,
-                "roomName": roomName
-            }
-        })
+        settings = iter(settings.items())
+        for command, setting in settings:
+            self.dispatch(self.setCommands, command, setting)
+            if self._handoff is not None:
+                remaining = dict(settings)
+                if remaining:
+                    self._handoff[2]["Set"] = remaining
+                return
 
-    def sendControlledRoomAuthStatus(self, success, username: str, roomname: str) -> None:
-        self.sendSet({
+    @setCommands.command("room", {"name": str})
+    def handleSetRoom(self, setting) -> None:
+        self._factory.setWatcherRoom(self._watcher, setting["name"])
+
+    @setCommands.command("file", (dict, type(None)))
+    def handleSetFile(self, setting) -> None:
+        self._watcher.setFile(setting)
+
+    @setCommands.command("controllerAuth", {"password?": _OPTIONAL_STR, "room?": _OPTIONAL_STR})
+    def handleSetControllerAuth(self, setting) -> None:
+        password = setting.get("password")
+        room = setting.get("room")
+        self._factory.authRoomController(self._watcher, password, room)
+
+    @setCommands.command("ready", {"isReady": _OPTIONAL_BOOL, "manuallyInitiated?": bool})
+    def handleSetReady(self, setting) -> None:
+        manual = setting.get('manuallyInitiated', False)
+        self._factory.setReady(self._watcher, setting['isReady'], manuallyInitiated=manual)
+
+    @setCommands.command("playlistChange", {"files": [str]})
+    def handleSetPlaylistChange(self, setting) -> None:
+        self._factory.setPlaylist(self._watcher, setting['files'])
+
+    @setCommands.command("playlistIndex", {"index": (int, type(None))})
+    def handleSetPlaylistIndex(self, setting) -> None:
+        self._factory.setPlaylistIndex(self._watcher, setting['index'])
+
+    @setCommands.command("features", dict)
+    def handleSetFeatures(self, setting) -> None:
+        self.setFeatures(setting)
+        self._factory.featuresChanged(self._watcher)
+
+    @staticmethod
+    def setMessage(setting) -> dict:
+        return {"Set": setting}
+
+    @staticmethod
+    def controlledRoomAuthStatusMessage(success, username: str, roomname: str) -> dict:
+        return SyncServerProtocol.setMessage({
             "controllerAuth": {
                 "user": username,
                 "room": roomname,
@@ -233,8 +575,9 @@ class SyncServerProtocol(JSONCommandProtocol):
             }
         })
 
-    def sendSetReady(self, username: str, isReady, manuallyInitiated: bool = True) -> None:
-        self.sendSet({
+    @staticmethod
+    def setReadyMessage(username: str, isReady, manuallyInitiated: bool = True) -> dict:
+        return SyncServerProtocol.setMessage({
             "ready": {
                 "username": username,
                 "isReady": isReady,
@@ -242,23 +585,26 @@ class SyncServerProtocol(JSONCommandProtocol):
             }
         })
 
-    def setPlaylist(self, username: str, files) -> None:
-        self.sendSet({
+    @staticmethod
+    def playlistMessage(username: str, files) -> dict:
+        return SyncServerProtocol.setMessage({
             "playlistChange": {
                 "user": username,
                 "files": files
             }
         })
 
-    def setPlaylistIndex(self, username: str, index: int) -> None:
-        self.sendSet({
+    @staticmethod
+    def playlistIndexMessage(username: str, index: int) -> dict:
+        return SyncServerProtocol.setMessage({
             "playlistIndex": {
                 "user": username,
                 "index": index
             }
         })
 
-    def sendUserSetting(self, username: str, room, file_, event) -> None:
+    @staticmethod
+    def userSettingMessage(username: str, room, file_, event) -> dict:
         room = {"name": room.name}
         user = {username: {}}
         user[username]["room"] = room
@@ -266,30 +612,50 @@ class SyncServerProtocol(JSONCommandProtocol):
             user[username]["file"] = file_
         if event:
             user[username]["event"] = event
-        self.sendSet({"user": user})
+        return SyncServerProtocol.setMessage({"user": user})
 
-    def _addUserOnList(self, userlist, watcher) -> None:
-        room = watcher.room
-        if room:
-            if room.name not in userlist:
-                userlist[room.name] = {}
-
-            userFile = {
-                "position": 0,
-                "file": watcher.getFile() if watcher.getFile() else {},
-                "controller": watcher.isController(),
-                "isReady": watcher.isReady(),
-                "features": watcher.getFeatures()
+    @staticmethod
+    def chatMessage(message) -> dict:
+        return {"Chat": message}
+
+    def sendSet(self, setting) -> None:
+        self.sendMessage(self.setMessage(setting))
+
+    def sendNewControlledRoom(self, roomName: str, password) -> None:
+        self.sendSet({
+            "newControlledRoom": {
+                "password": password,
+                "roomName": roomName
             }
-            userlist[room.name][watcher.name] = userFile
+        })
+
+    def sendControlledRoomAuthStatus(self, success, username: str, roomname: str) -> None:
+        self.sendMessage(self.controlledRoomAuthStatusMessage(success, username, roomname))
+
+    def sendSetReady(self, username: str, isReady, manuallyInitiated: bool = True) -> None:
+        self.sendMessage(self.setReadyMessage(username, isReady, manuallyInitiated))
+
+    def setPlaylist(self, username: str, files) -> None:
+        self.sendMessage(self.playlistMessage(username, files))
+
+    def setPlaylistIndex(self, username: str, index: int) -> None:
+        self.sendMessage(self.playlistIndexMessage(username, index))
+
+    def sendUserSetting(self, username: str, room, file_, event) -> None:
+        self.sendMessage(self.userSettingMessage(username, room, file_, event))
 
     def sendList(self) -> None:
-        userlist = {}
-        watchers = self._factory.getAllWatchersForUser(self._watcher)
-        for watcher in watchers:
-            self._addUserOnList(userlist, watcher)
-        self.sendMessage({"List": userlist})
+        self._factory.getUserList(self._watcher).addCallback(self._sendListLine)
+
+    def _sendListLine(self, line: bytes) -> None:
+        # Other workers may take a moment to answer, during which the
+        # watcher can leave or move to another worker
+        if self._watcher is None or self._watcher.room is None:
+            return
+        self.sendLine(line)
+        self._metrics.countSent("List", len(line) + len(self.delimiter))
 
+    @commands.command("List")
     @requireLogged
     def handleList(self, _) -> None:
         self.sendList()
@@ -326,7 +692,9 @@ class SyncServerProtocol(JSONCommandProtocol):
                 state["ignoringOnTheFly"]["client"] = self.clientIgnoringOnTheFly
                 self.clientIgnoringOnTheFly = 0
         if self.serverIgnoringOnTheFly == 0 or forced:
-            self.sendMessage({"State": state})
+            line = self.encodeMessage({"State": state})
+            self._sendStateLine(line, doSeek)
+            self._metrics.countSent("State", len(line) + len(self.delimiter))
 
     def _extractStatePlaystateArguments(self, state):
         position = state["playstate"].get("position", 0)
@@ -334,6 +702,11 @@ class SyncServerProtocol(JSONCommandProtocol):
         doSeek = state["playstate"].get("doSeek")
         return position, paused, doSeek
 
+    @commands.command("State", {
+        "playstate?": {"position?": _OPTIONAL_NUMBER, "paused?": _OPTIONAL_BOOL, "doSeek?": _OPTIONAL_BOOL},
+        "ping?": {"latencyCalculation?": _OPTIONAL_NUMBER, "clientRtt?": _NUMBER, "clientLatencyCalculation?": _NUMBER},
+        "ignoringOnTheFly?": {"server?": int, "client?": int},
+    })
     @requireLogged
     def handleState(self, state) -> None:
         position, paused, doSeek, latencyCalculation = None, None, None, None
@@ -346,6 +719,9 @@ class SyncServerProtocol(JSONCommandProtocol):
                 self.clientIgnoringOnTheFly = ignore["client"]
         if "playstate" in state:
             position, paused, doSeek = self._extractStatePlaystateArguments(state)
+            if doSeek and self.rateLimiter is not None and not self.rateLimiter.allow("State.seek"):
+                self.rateLimited("State.seek")
+                position, paused, doSeek = None, None, None
         if "ping" in state:
             latencyCalculation = state["ping"].get("latencyCalculation", 0)
             clientRtt = state["ping"].get("clientRtt", 0)
@@ -355,6 +731,7 @@ class SyncServerProtocol(JSONCommandProtocol):
         if self.serverIgnoringOnTheFly == 0:
             self._watcher.updateState(position, paused, doSeek, self._pingService.getLastForwardDelay())
 
+    @commands.command("Error", {"message": None})
     def handleError(self, error) -> None:
         # TODO: more processing and fallbacking
         self.dropWithError(error["message"])
@@ -365,23 +742,27 @@ class SyncServerProtocol(JSONCommandProtocol):
     def sendTLS(self, message) -> None:
         self.sendMessage({"TLS": message})
 
+    @commands.command("TLS", {"startTLS": str})
     def handleTLS(self, message) -> None:
         inquiry = message.get("startTLS")
         if "send" in inquiry:
             if not self.isLogged() and self._factory.serverAcceptsTLS:
-                lastEditCertTime = self._factory.checkLastEditCertTime()
-                if lastEditCertTime is not None and lastEditCertTime != self._factory.lastEditCertTime:
-                    self._factory.updateTLSContextFactory()
                 if self._factory.options is not None:
                     self.sendTLS({"startTLS": "true"})
+                    # The answer has to leave before the handshake starts
+                    self.flush(force=True)
                     self.transport.startTLS(self._factory.options)
+                    self._metrics.tlsUpgrades += 1
                 else:
                     self.sendTLS({"startTLS": "false"})
+                    self._metrics.tlsRefused += 1
             else:
                 self.sendTLS({"startTLS": "false"})
+                self._metrics.tlsRefused += 1
 
 
 class PingService:
+    __slots__ = ("_rtt", "_fd", "_avrRtt")
     _rtt: float
     _fd: float
     _avrRtt: float
@@ -0,0 +1,187 @@
+import random
+import time
+
+from twisted.internet import task, reactor
+
+from syncplay import constants
+
+
+class StateScheduler:
+    """Drives periodic State updates for every watcher from one reactor timer.
+
+    Watchers are hashed into the slots of a timing wheel that completes one
+    turn per SERVER_STATE_INTERVAL. Each reactor tick visits a single slot,
+    so every watcher is still served once per interval while the work (and
+    the resulting writes) is spread evenly over the interval. The callback
+    receives the number of the current turn, which lets rooms cache results
+    once per interval however their members are spread over the slots.
+    """
+
+    def __init__(self, callback, interval: float = constants.SERVER_STATE_INTERVAL,
+                 slots: int = constants.SERVER_STATE_WHEEL_SLOTS, clock=None):
+        self._callback = callback
+        self._interval = interval
+        self._slots = [{} for _ in range(slots)]
+        self._slotOf = {}
+        self._cursor = 0
+        self._clock = clock if clock is not None else reactor
+        self._timer = None
+
+        self.ticks = 0
+        self.turns = 0
+        self.lastTickSize = 0
+        self.lastTickDuration = 0.0
+        self.maxTickDuration = 0.0
+        self.totalTickDuration = 0.0
+
+    @property
+    def tickInterval(self) -> float:
+        return self._interval / len(self._slots)
+
+    def start(self) -> None:
+        if self._timer is None:
+            self._timer = task.LoopingCall(self._advance)
+            self._timer.clock = self._clock
+            self._timer.start(self.tickInterval, now=False)
+
+    def stop(self) -> None:
+        if self._timer is not None and self._timer.running:
+            self._timer.stop()
+        self._timer = None
+
+    def schedule(self, item) -> None:
+        if item in self._slotOf:
+            return
+        index = random.randrange(len(self._slots))
+        self._slots[index][item] = None
+        self._slotOf[item] = index
+
+    def unschedule(self, item) -> None:
+        index = self._slotOf.pop(item, None)
+        if index is not None:
+            del self._slots[index][item]
+
+    def isScheduled(self, item) -> bool:
+        return item in self._slotOf
+
+    def __len__(self) -> int:
+        return len(self._slotOf)
+
+    def _advance(self) -> None:
+        index = self._cursor
+        self._cursor = (index + 1) % len(self._slots)
+        self.ticks += 1
+        if index == 0:
+            self.turns += 1
+        slot = self._slots[index]
+        if not slot:
+            self.lastTickSize = 0
+            return
+        started = time.perf_counter()
+        turn = self.turns
+        # Callbacks may drop watchers (and so unschedule them) mid-tick
+        for item in list(slot):
+            if item in slot:
+                self._callback(item, turn)
+        duration = time.perf_counter() - started
+        self.lastTickSize = len(slot)
+        self.lastTickDuration = duration
+        self.totalTickDuration += duration
+        if duration > self.maxTickDuration:
+            self.maxTickDuration = duration
+
+    def getStats(self) -> dict:
+        return {
+            "scheduled": len(self._slotOf),
+            "slots": len(self._slots),
+            "tickInterval": self.tickInterval,
+            "ticks": self.ticks,
+            "turns": self.turns,
+            "lastTickSize": self.lastTickSize,
+            "lastTickDuration": self.lastTickDuration,
+            "maxTickDuration": self.maxTickDuration,
+            "avgTickDuration": self.totalTickDuration / self.ticks if self.ticks else 0.0,
+        }
+
+
+class IdleReaper:
+    """Times out idle connections from one reactor timer.
+
+    Items sit in the slot of a timing wheel for the deadline they had when
+    they were filed, and report their current one through idleDeadline()
+    (None to stop watching them). Activity therefore costs nothing here:
+    a slot coming due re-files the items whose deadline moved on and hands
+    every item that did expire to the callback in a single batch.
+    """
+
+    def __init__(self, callback, resolution: float = constants.IDLE_REAPER_RESOLUTION,
+                 slots: int = constants.IDLE_REAPER_SLOTS, clock=None):
+        self._callback = callback
+        self._resolution = resolution
+        # Keyed by id(), as connections do not hash by identity
+        self._slots = [{} for _ in range(slots)]
+        self._slotOf = {}
+        self._clock = clock if clock is not None else reactor
+        # Next tick whose slot is due
+        self._cursor = self._tickOf(self._clock.seconds())
+        self._timer = None
+        self.reaped = 0
+
+    def _tickOf(self, when: float) -> int:
+        return int(when // self._resolution)
+
+    def start(self) -> None:
+        if self._timer is None:
+            self._timer = task.LoopingCall(self._advance)
+            self._timer.clock = self._clock
+            self._timer.start(self._resolution, now=False)
+
+    def stop(self) -> None:
+        if self._timer is not None and self._timer.running:
+            self._timer.stop()
+        self._timer = None
+
+    def watch(self, item) -> None:
+        self.unwatch(item)
+        deadline = item.idleDeadline()
+        if deadline is not None:
+            self._file(item, deadline)
+
+    def unwatch(self, item) -> None:
+        index = self._slotOf.pop(id(item), None)
+        if index is not None:
+            del self._slots[index][id(item)]
+
+    def __len__(self) -> int:
+        return len(self._slotOf)
+
+    def _file(self, item, deadline: float) -> None:
+        # Deadlines past the end of the wheel wrap around and get re-filed
+        # when their slot comes due early
+        index = max(self._tickOf(deadline), self._cursor) % len(self._slots)
+        self._slots[index][id(item)] = item
+        self._slotOf[id(item)] = index
+
+    def _advance(self) -> None:
+        now = self._clock.seconds()
+        last = self._tickOf(now)
+        expired = []
+        # A late timer catches up, but one turn of the wheel visits everything
+        first = max(self._cursor, last - len(self._slots) + 1)
+        # Items still alive are re-filed from the next tick on
+        self._cursor = last + 1
+        for tick in range(first, last + 1):
+            index = tick % len(self._slots)
+            slot, self._slots[index] = self._slots[index], {}
+            for key, item in slot.items():
+                del self._slotOf[key]
+                deadline = item.idleDeadline()
+                if deadline is None:
+                    continue
+                if deadline <= now:
+                    expired.append(item)
+                else:
+                    self._file(item, deadline)
+        if expired:
+            self.reaped += len(expired)
+            self._callback(expired)
@@ -1,6 +1,9 @@
 import argparse
 import codecs
+import collections
 import hashlib
+import heapq
+import itertools
 import os
 import time
 from string import Template
@@ -9,7 +12,7 @@ import logging
 import pem
 
 from twisted.enterprise import adbapi
-from twisted.internet import task, reactor
+from twisted.internet import defer, task, threads, reactor
 from twisted.internet.protocol import ServerFactory
 
 try:
@@ -19,10 +22,14 @@ except:
     pass
 
 import syncplay
-from syncplay import constants
+from syncplay import constants, statsdb
+from syncplay.jsoncodec import getCodec
 from syncplay.messages import getMessage
+from syncplay.metrics import CommandStats, HandlerProfiler, ServerMetrics
 from syncplay.protocols import SyncServerProtocol
-from syncplay.utils import RoomPasswordProvider, NotControlledRoom, RandomStringGenerator, meetsMinVersion, playlistIsValid, truncateText
+from syncplay.scheduler import IdleReaper, StateScheduler
+from syncplay.utils import RoomPasswordProvider, NotControlledRoom, RandomStringGenerator, getClientProfile, playlistIsValid, \
+    raiseFileDescriptorLimit, truncateText
 
 
 class SyncFactory(ServerFactory):
@@ -38,11 +45,24 @@ class SyncFactory(ServerFactory):
     serverAcceptsTLS: bool
     _TLSattempts: int
 
+    # Methods timed by the handler profiler, alongside every protocol command
+    PROFILED_SITES = (
+        "sendState", "setWatcherRoom", "sendRoomSwitchMessage", "sendLeftMessage", "sendJoinMessage",
+        "sendFileUpdate", "forcePositionUpdate", "authRoomController", "sendChat", "setReady",
+        "setPlaylist", "setPlaylistIndex", "deliverRemoteBroadcast", "_broadcast", "_broadcastRoom",
+    )
+
     def __init__(self, port: str = '', password: str = '', motdFilePath=None, isolateRooms: bool = False, salt=None,
                  disableReady: bool = False, disableChat: bool = False, maxChatMessageLength: int = constants.MAX_CHAT_MESSAGE_LENGTH,
-                 maxUsernameLength: int = constants.MAX_USERNAME_LENGTH, statsDbFile=None, tlsCertPath=None):
+                 maxUsernameLength: int = constants.MAX_USERNAME_LENGTH, statsDbFile=None, tlsCertPath=None,
+                 jsonCodec: str = "auto", statsRetentionDays: int = constants.STATS_RAW_RETENTION_DAYS,
+                 statsHourlyRetentionDays: int = constants.STATS_HOURLY_RETENTION_DAYS, interestRouting: bool = False,
+                 disableRateLimits: bool = False, maxConnections: int = constants.MAX_CONNECTIONS,
+                 maxConnectionsPerIp: int = constants.MAX_CONNECTIONS_PER_IP,
+                 maxPendingHellos: int = constants.MAX_PENDING_HELLOS):
         logging.info(getMessage("welcome-server-notification").format(syncplay.version))
         self.isolateRooms = isolateRooms
+        self.interestRouting = interestRouting and not isolateRooms
         self.port = port
 
         if password:
@@ -55,45 +75,197 @@ class SyncFactory(ServerFactory):
             logging.warning(getMessage("no-salt-notification").format(salt))
         self._salt = salt
         self._motdFilePath = motdFilePath
+        self._motd = MotdTemplate(motdFilePath) if motdFilePath else None
         self.disableReady = disableReady
         self.disableChat = disableChat
+        self.rateLimits = None if disableRateLimits else constants.RATE_LIMITS
 
         self.maxChatMessageLength = maxChatMessageLength
         self.maxUsernameLength = maxUsernameLength
 
-        if not isolateRooms:
-            self._roomManager = RoomManager()
+        self.codec = getCodec(jsonCodec)
+        logging.info(f"Using the {self.codec.name} JSON codec.")
+        self.commandStats = CommandStats()
+        self.metrics = ServerMetrics(self.commandStats)
+        self.profiler = HandlerProfiler(self.commandStats, self, self.PROFILED_SITES)
+        if not maxConnections:
+            fileLimit = raiseFileDescriptorLimit()
+            if fileLimit:
+                maxConnections = max(fileLimit - constants.RESERVED_FILE_DESCRIPTORS, 1)
+        self._admission = AdmissionControl(self.metrics, maxConnections, maxConnectionsPerIp, maxPendingHellos)
+
+        if self.interestRouting:
+            self._roomManager = InterestRoomManager(self.codec, self.metrics)
+        elif not isolateRooms:
+            self._roomManager = RoomManager(self.codec, self.metrics)
         else:
-            self._roomManager = PublicRoomManager()
+            self._roomManager = PublicRoomManager(self.codec, self.metrics)
+
+        self._workerNode = None
+        self._unflushed = []
+        self._flushCall = None
+        self._stateScheduler = StateScheduler(self._sendScheduledState)
+        self._stateScheduler.start()
+        self._idleReaper = IdleReaper(self._reapIdle)
+        self._idleReaper.start()
 
         self._statsDbHandle = None
         if statsDbFile is not None:
-            self._statsDbHandle = DBManager(statsDbFile)
-            self._statsRecorder = StatsRecorder(self._statsDbHandle, self._roomManager)
+            self._statsDbHandle = DBManager(statsDbFile, statsRetentionDays, statsHourlyRetentionDays)
+            self._statsRecorder = StatsRecorder(self._statsDbHandle, self._roomManager, self.metrics)
             statsDelay = 5 * (int(self.port) % 10 + 1)
             self._statsRecorder.startRecorder(statsDelay)
 
         self.certPath = tlsCertPath
         self.serverAcceptsTLS = False
+        self.options = None
         self._TLSattempts = 0
+        self._certIdentity = None
+        self._failedCertIdentity = None
+        self._certReload = None
         if self.certPath is not None:
             self._allowTLSconnections(self.certPath)
-        else:
-            self.options = None
+            self._certWatcher = task.LoopingCall(self._checkCertificates)
+            self._certWatcher.start(constants.TLS_CERT_CHECK_INTERVAL, now=False)
 
     def buildProtocol(self, addr):
-        return SyncServerProtocol(self)
+        host = getattr(addr, "host", None)
+        if not self._admission.admits(host):
+            # Twisted closes the socket straight away
+            return None
+        watcherProtocol = SyncServerProtocol(self)
+        self._admission.admit(watcherProtocol, host)
+        self._idleReaper.watch(watcherProtocol)
+        return watcherProtocol
+
+    def buildAdoptedProtocol(self, addr):
+        # Connections handed over by another worker were admitted there
+        watcherProtocol = SyncServerProtocol(self)
+        self._admission.admit(watcherProtocol, None, awaitingHello=False)
+        self._idleReaper.watch(watcherProtocol)
+        return watcherProtocol
+
+    def helloReceived(self, watcherProtocol) -> None:
+        self._admission.helloReceived(watcherProtocol)
+
+    def connectionClosed(self, watcherProtocol) -> None:
+        self._admission.release(watcherProtocol)
+        self._idleReaper.unwatch(watcherProtocol)
+
+    def _reapIdle(self, expired: list) -> None:
+        for watcherProtocol in expired:
+            watcherProtocol.idleTimedOut()
+
+    def scheduleFlush(self, watcherProtocol) -> None:
+        self._unflushed.append(watcherProtocol)
+        if self._flushCall is None:
+            self._flushCall = reactor.callLater(0, self.flushWrites)
+
+    def flushWrites(self) -> None:
+        if self._flushCall is not None and self._flushCall.active():
+            self._flushCall.cancel()
+        self._flushCall = None
+        unflushed, self._unflushed = self._unflushed, []
+        for watcherProtocol in unflushed:
+            watcherProtocol.flush()
+
+    def setWorkerNode(self, workerNode) -> None:
+        self._workerNode = workerNode
+        self._roomManager.setReservedNames(workerNode.remoteNames)
+
+    def handOffConnection(self, watcherProtocol, resume: dict) -> bool:
+        if self._workerNode is None:
+            return False
+        link = self._workerNode.routeRoom(resume["room"])
+        if link is None:
+            return False
+        watcherProtocol.handOff(link, resume)
+        return True
+
+    def _handOffWatcher(self, watcher: 'Watcher', roomName: str) -> bool:
+        if self._workerNode is None:
+            return False
+        link = self._workerNode.routeRoom(roomName)
+        if link is None:
+            return False
+        connector = watcher.connector
+        resume = {
+            "username": watcher.name,
+            "room": roomName,
+            "version": watcher.version,
+            "features": watcher.getFeatures(),
+            "file": watcher.file,
+            "ready": watcher.ready,
+            "switch": True,
+        }
+        # Users elsewhere learn about the move from the new worker's room
+        # switch message; the room left behind only hears about it if the
+        # switch message will not reach it
+        if self.isolateRooms or self.interestRouting:
+            self.sendLeftMessage(watcher)
+        self._roomManager.removeWatcher(watcher)
+        connector.setWatcher(None)
+        connector.handOff(link, resume)
+        return True
+
+    def completeHandoff(self, watcherProtocol, link, resume: dict, unhandled: bytes) -> None:
+        self._workerNode.handOff(watcherProtocol, link, resume, unhandled)
 
-    def sendState(self, watcher: 'Watcher', doSeek: bool = False, forcedUpdate: bool = False) -> None:
+    def resumeWatcher(self, watcherProtocol, username: str, roomName: str, file_, ready) -> None:
+        # The client keeps the name it has; only two workers letting in the
+        # same new name at once leaves it taken here
+        roomName = truncateText(roomName, constants.MAX_ROOM_NAME_LENGTH)
+        if self._roomManager.isUsernameTaken(username):
+            self._workerNode.releaseName(username)
+            watcherProtocol.dropWithError(getMessage("username-taken-server-error").format(username))
+            return
+        self._workerNode.claimName(username)
+        watcher = Watcher(self, watcherProtocol, username)
+        watcher.ready = ready
+        self._idleReaper.watch(watcherProtocol)
+        self.setWatcherRoom(watcher, roomName)
+        if file_ is not None:
+            watcher.setFile(file_)
+
+    def deliverRemoteBroadcast(self, line: bytes) -> None:
+        self._roomManager.broadcastEncoded(None, line)
+
+    def sendState(self, watcher: 'Watcher', doSeek: bool = False, forcedUpdate: bool = False, turn=None) -> None:
         room = watcher.room
         if room:
-            paused, position = room.isPaused(), room.getPosition()
-            setBy = room.setBy
+            started = time.perf_counter()
+            position, paused, setBy = room.getStateSnapshot(turn)
             watcher.sendState(position, paused, doSeek, setBy, forcedUpdate)
+            self.metrics.stateSendSeconds.observe(time.perf_counter() - started)
+
+    def _sendScheduledState(self, watcher: 'Watcher', turn: int) -> None:
+        self.sendState(watcher, turn=turn)
+
+    def scheduleStateUpdates(self, watcher: 'Watcher') -> None:
+        self._stateScheduler.schedule(watcher)
+
+    def cancelStateUpdates(self, watcher: 'Watcher') -> None:
+        self._stateScheduler.unschedule(watcher)
+
+    def getStateSchedulerStats(self) -> dict:
+        return self._stateScheduler.getStats()
+
+    def getCommandStats(self) -> dict:
+        return self.commandStats.getStats()
+
+    def toggleProfiling(self) -> None:
+        if self.profiler.toggle():
+            logging.info(getMessage("server-profiling-enabled-notification"))
+        else:
+            logging.info(getMessage("server-profiling-disabled-notification"))
+
+    def logProfile(self) -> None:
+        logging.info(getMessage("server-profiling-report-notification").format(self.profiler.report()))
 
     def getFeatures(self) -> dict:
         features = {
             "isolateRooms": self.isolateRooms,
+            "interestRouting": self.interestRouting,
             "readiness": not self.disableReady,
             "managedRooms": True,
             "chat": not self.disableChat,
@@ -107,35 +279,29 @@ class SyncFactory(ServerFactory):
     def getMotd(self, userIp, username: str, room, clientVersion: str) -> str:
         oldClient = False
         if constants.WARN_OLD_CLIENTS:
-            if not meetsMinVersion(clientVersion, constants.RECENT_CLIENT_THRESHOLD):
+            if not getClientProfile(clientVersion).supports(constants.CAPABILITY_RECENT_CLIENT):
                 oldClient = True
-        if self._motdFilePath and os.path.isfile(self._motdFilePath):
-            args = {"version": syncplay.version, "userIp": userIp, "username": username, "room": room}
-            tmpl = codecs.open(self._motdFilePath, "r", "utf-8-sig").read()
-            try:
-                motd = Template(tmpl).substitute(args)
-                if oldClient:
-                    motdwarning = getMessage("new-syncplay-available-motd-message").format(clientVersion)
-                    motd = f"{motdwarning}\n{motd}"
-                if len(motd) < constants.SERVER_MAX_TEMPLATE_LENGTH:
-                    return motd
-                else:
-                    return getMessage("server-messed-up-motd-too-long").format(constants.SERVER_MAX_TEMPLATE_LENGTH, len(motd))
-            except ValueError:
-                return getMessage("server-messed-up-motd-unescaped-placeholders")
-        elif oldClient:
-            return getMessage("new-syncplay-available-motd-message").format(clientVersion)
-        else:
-            return ""
+        warning = getMessage("new-syncplay-available-motd-message").format(clientVersion) if oldClient else None
+        if self._motd is not None:
+            motd = self._motd.render(userIp, username, room, warning)
+            if motd is not None:
+                return motd
+        return warning or ""
 
     def addWatcher(self, watcherProtocol, username: str, roomName: str) -> None:
         roomName = truncateText(roomName, constants.MAX_ROOM_NAME_LENGTH)
         username = self._roomManager.findFreeUsername(username)
+        if self._workerNode is not None:
+            self._workerNode.claimName(username)
         watcher = Watcher(self, watcherProtocol, username)
+        # Its deadline now depends on the State updates the watcher sends
+        self._idleReaper.watch(watcherProtocol)
         self.setWatcherRoom(watcher, roomName, asJoin=True)
 
     def setWatcherRoom(self, watcher: 'Watcher', roomName: str, asJoin: bool = False) -> None:
         roomName = truncateText(roomName, constants.MAX_ROOM_NAME_LENGTH)
+        if not asJoin and watcher.room is not None and self._handOffWatcher(watcher, roomName):
+            return
         self._roomManager.moveWatcher(watcher, roomName)
         if asJoin:
             self.sendJoinMessage(watcher)
@@ -150,31 +316,39 @@ class SyncFactory(ServerFactory):
             for controller in room.controllers:
                 watcher.sendControlledRoomAuthStatus(True, controller, roomName)
 
+    def _broadcast(self, watcher: 'Watcher', message: dict, receiverFilter=None) -> None:
+        line = self.codec.dumps(message)
+        self._roomManager.broadcastEncoded(watcher, line, receiverFilter)
+        if self._workerNode is not None and not self.isolateRooms:
+            self._workerNode.publish(line)
+
+    def _broadcastRoom(self, watcher: 'Watcher', message: dict, receiverFilter=None) -> None:
+        line = self.codec.dumps(message)
+        self._roomManager.broadcastRoomEncoded(watcher, line, receiverFilter)
+
     def sendRoomSwitchMessage(self, watcher: 'Watcher') -> None:
-        l = lambda w: w.sendSetting(watcher.name, watcher.room, None, None)
-        self._roomManager.broadcast(watcher, l)
-        l = lambda w: w.sendSetReady(watcher.name, watcher.ready, False)
-        self._roomManager.broadcastRoom(watcher, l)
+        self._broadcast(watcher, SyncServerProtocol.userSettingMessage(watcher.name, watcher.room, None, None))
+        self._broadcastRoom(watcher, SyncServerProtocol.setReadyMessage(watcher.name, watcher.ready, False))
 
     def removeWatcher(self, watcher: 'Watcher') -> None:
         if watcher and watcher.room:
             self.sendLeftMessage(watcher)
             self._roomManager.removeWatcher(watcher)
+            if self._workerNode is not None:
+                self._workerNode.releaseName(watcher.name)
 
     def sendLeftMessage(self, watcher: 'Watcher') -> None:
-        l = lambda w: w.sendSetting(watcher.name, watcher.room, None, {"left": True})
-        self._roomManager.broadcast(watcher, l)
+        self._broadcast(watcher, SyncServerProtocol.userSettingMessage(watcher.name, watcher.room, None, {"left": True}))
 
     def sendJoinMessage(self, watcher: 'Watcher') -> None:
-        l = lambda w: w.sendSetting(watcher.name, watcher.room, None, {"joined": True, "version": watcher.version, "features": watcher.getFeatures()}) if w != watcher else None
-        self._roomManager.broadcast(watcher, l)
-        l = lambda w: w.sendSetReady(watcher.name, watcher.ready, False)
-        self._roomManager.broadcastRoom(watcher, l)
+        event = {"joined": True, "version": watcher.version, "features": watcher.getFeatures()}
+        message = SyncServerProtocol.userSettingMessage(watcher.name, watcher.room, None, event)
+        self._broadcast(watcher, message, lambda w: w is not watcher)
+        self._broadcastRoom(watcher, SyncServerProtocol.setReadyMessage(watcher.name, watcher.ready, False))
 
     def sendFileUpdate(self, watcher: 'Watcher') -> None:
         if watcher.file is not None:
-            l = lambda w: w.sendSetting(watcher.name, watcher.room, watcher.file, None)
-            self._roomManager.broadcast(watcher, l)
+            self._broadcast(watcher, SyncServerProtocol.userSettingMessage(watcher.name, watcher.room, watcher.file, None))
 
     def forcePositionUpdate(self, watcher: 'Watcher', doSeek, watcherPauseState) -> None:
         room = watcher.room
@@ -191,6 +365,21 @@ class SyncFactory(ServerFactory):
     def getAllWatchersForUser(self, forUser):
         return self._roomManager.getAllWatchersForUser(forUser)
 
+    def getUserList(self, forUser) -> defer.Deferred:
+        # Rooms of a non-isolated server may live on any worker
+        if self._workerNode is None or self.isolateRooms:
+            return defer.succeed(self._roomManager.encodeUserList(forUser))
+        gathering = self._workerNode.gatherRosters()
+        gathering.addCallback(lambda rosters: self._roomManager.encodeUserList(forUser, rosters))
+        return gathering
+
+    def encodeRosters(self) -> list:
+        return self._roomManager.encodeRosters()
+
+    def featuresChanged(self, watcher: 'Watcher') -> None:
+        watcher.rosterChanged()
+        self._roomManager.updateInterest(watcher)
+
     def authRoomController(self, watcher: 'Watcher', password, roomBaseName=None) -> None:
         room = watcher.room
         roomName = roomBaseName if roomBaseName else room.name
@@ -198,27 +387,28 @@ class SyncFactory(ServerFactory):
             success = RoomPasswordProvider.check(roomName, password, self._salt)
             if success:
                 watcher.room.addController(watcher)
-            self._roomManager.broadcast(watcher, lambda w: w.sendControlledRoomAuthStatus(success, watcher.name, room._name))
+            self._broadcast(watcher, SyncServerProtocol.controlledRoomAuthStatusMessage(success, watcher.name, room._name))
         except NotControlledRoom:
             newName = RoomPasswordProvider.getControlledRoomName(roomName, password, self._salt)
             watcher.sendNewControlledRoom(newName, password)
         except ValueError:
-            self._roomManager.broadcastRoom(watcher, lambda w: w.sendControlledRoomAuthStatus(False, watcher.name, room._name))
+            self._broadcastRoom(watcher, SyncServerProtocol.controlledRoomAuthStatusMessage(False, watcher.name, room._name))
 
     def sendChat(self, watcher, message) -> None:
         message = truncateText(message, self.maxChatMessageLength)
         messageDict = {"message": message, "username": watcher.name}
-        self._roomManager.broadcastRoom(watcher, lambda w: w.sendChatMessage(messageDict))
+        self._broadcastRoom(watcher, SyncServerProtocol.chatMessage(messageDict),
+                            lambda w: w.capabilities & constants.CAPABILITY_CHAT)
 
     def setReady(self, watcher, isReady, manuallyInitiated: bool = True) -> None:
         watcher.ready = isReady
-        self._roomManager.broadcastRoom(watcher, lambda w: w.sendSetReady(watcher.name, watcher.ready, manuallyInitiated))
+        self._broadcastRoom(watcher, SyncServerProtocol.setReadyMessage(watcher.name, watcher.ready, manuallyInitiated))
 
     def setPlaylist(self, watcher, files) -> None:
         room = watcher.room
         if room.canControl(watcher) and playlistIsValid(files):
             watcher.room.setPlaylist(files, watcher)
-            self._roomManager.broadcastRoom(watcher, lambda w: w.setPlaylist(watcher.name, files))
+            self._broadcastRoom(watcher, SyncServerProtocol.playlistMessage(watcher.name, files))
         else:
             watcher.setPlaylist(room.name, room.playlist)
             watcher.setPlaylistIndex(room.name, room.playlistIndex)
@@ -227,75 +417,257 @@ class SyncFactory(ServerFactory):
         room = watcher.room
         if room.canControl(watcher):
             watcher.room.setPlaylistIndex(index, watcher)
-            self._roomManager.broadcastRoom(watcher, lambda w: w.setPlaylistIndex(watcher.name, index))
+            self._broadcastRoom(watcher, SyncServerProtocol.playlistIndexMessage(watcher.name, index))
         else:
             watcher.setPlaylistIndex(room.name, room.playlistIndex)
 
+    def _certificateIdentity(self, path: str):
+        # Renewals replace both files, and not necessarily at the same time
+        try:
+            return tuple(
+                (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+                for stat in (os.stat(path+'/privkey.pem'), os.stat(path+'/fullchain.pem'))
+            )
+        except OSError:
+            return None
+
+    @staticmethod
+    def _buildTLSOptions(path: str):
+        privKeyPath = path+'/privkey.pem'
+        chainPath = path+'/fullchain.pem'
+
+        cipherListString = "ECDHE-ECDSA-CHACHA20-POLY1305:ECDHE-RSA-CHACHA20-POLY1305:"\
+                           "ECDHE-ECDSA-AES128-GCM-SHA256:ECDHE-RSA-AES128-GCM-SHA256:"\
+                           "ECDHE-ECDSA-AES256-GCM-SHA384:ECDHE-RSA-AES256-GCM-SHA384"
+        accCiphers = ssl.AcceptableCiphers.fromOpenSSLCipherString(cipherListString)
+
+        try:
+            contextFactory = pem.twisted.certificateOptionsFromFiles(
+                privKeyPath,
+                chainPath,
+                acceptableCiphers=accCiphers,
+                raiseMinimumTo=ssl.TLSVersion.TLSv1_2,
+                enableSessions=True,
+                enableSessionTickets=True
+            )
+        except AttributeError:
+            contextFactory = pem.twisted.certificateOptionsFromFiles(
+                privKeyPath,
+                chainPath,
+                acceptableCiphers=accCiphers,
+                method=TLSv1_2_METHOD,
+                enableSessions=True,
+                enableSessionTickets=True
+            )
+        # Load the key and chain into the SSL context now rather than
+        # during the first handshake that uses it
+        contextFactory.getContext()
+        return contextFactory
+
     def _allowTLSconnections(self, path: str) -> None:
         try:
-            privKeyPath = path+'/privkey.pem'
-            chainPath = path+'/fullchain.pem'
-
-            self.lastEditCertTime = os.path.getmtime(chainPath)
-
-            cipherListString = "ECDHE-ECDSA-CHACHA20-POLY1305:ECDHE-RSA-CHACHA20-POLY1305:"\
-                               "ECDHE-ECDSA-AES128-GCM-SHA256:ECDHE-RSA-AES128-GCM-SHA256:"\
-                               "ECDHE-ECDSA-AES256-GCM-SHA384:ECDHE-RSA-AES256-GCM-SHA384"
-            accCiphers = ssl.AcceptableCiphers.fromOpenSSLCipherString(cipherListString)
-
-            try:
-                contextFactory = pem.twisted.certificateOptionsFromFiles(
-                    privKeyPath,
-                    chainPath,
-                    acceptableCiphers=accCiphers,
-                    raiseMinimumTo=ssl.TLSVersion.TLSv1_2
-                )
-            except AttributeError:
-                contextFactory = pem.twisted.certificateOptionsFromFiles(
-                    privKeyPath,
-                    chainPath,
-                    acceptableCiphers=accCiphers,
-                    method=TLSv1_2_METHOD
-                )
-
-            self.options = contextFactory
-            self.serverAcceptsTLS = True
-            self._TLSattempts = 0
-            logging.info("TLS support is enabled.")
+            identity = self._certificateIdentity(path)
+            self._useTLSOptions(self._buildTLSOptions(path), identity)
         except Exception:
             self.options = None
             self.serverAcceptsTLS = False
-            self.lastEditCertTime = None
             logging.exception("Error while loading the TLS certificates.")
             logging.info("TLS support is not enabled.")
 
-    def checkLastEditCertTime(self):
-        try:
-            outTime = os.path.getmtime(self.certPath+'/fullchain.pem')
-        except:
-            outTime = None
-        return outTime
+    def _useTLSOptions(self, options, identity) -> None:
+        self.options = options
+        self._certIdentity = identity
+        self.serverAcceptsTLS = True
+        self._TLSattempts = 0
+        logging.info("TLS support is enabled.")
 
-    def updateTLSContextFactory(self) -> None:
-        self._allowTLSconnections(self.certPath)
+    def _checkCertificates(self) -> None:
+        if self._certReload is not None:
+            return
+        identity = self._certificateIdentity(self.certPath)
+        if identity is None or identity == self._certIdentity:
+            return
+        if identity != self._failedCertIdentity:
+            self._TLSattempts = 0
+        elif self._TLSattempts >= constants.TLS_CERT_ROTATION_MAX_RETRIES:
+            return
+        # Clients keep getting the current context until the new one is ready
+        self._certReload = threads.deferToThread(self._buildTLSOptions, self.certPath)
+        self._certReload.addCallbacks(self._useTLSOptions, self._certReloadFailed, callbackArgs=(identity,), errbackArgs=(identity,))
+        self._certReload.addBoth(self._certReloadDone)
+
+    def _certReloadFailed(self, failure, identity) -> None:
+        self._failedCertIdentity = identity
         self._TLSattempts += 1
-        if self._TLSattempts < constants.TLS_CERT_ROTATION_MAX_RETRIES:
-            self.serverAcceptsTLS = True
+        logging.error("Error while reloading the TLS certificates: %s", failure.getErrorMessage())
+
+    def _certReloadDone(self, _) -> None:
+        self._certReload = None
+
+
+class AdmissionControl:
+    """Decides at accept time whether a connection is let in.
+
+    Limits of 0 are unlimited. While MAX_PENDING_HELLOS connections from one
+    address are yet to log in no further ones from it are accepted; the idle
+    reaper drops those that take longer than HELLO_TIMEOUT.
+    """
+
+    def __init__(self, metrics, maxConnections: int, maxConnectionsPerIp: int, maxPendingHellos: int):
+        self._metrics = metrics
+        self._maxConnections = maxConnections
+        self._maxConnectionsPerIp = maxConnectionsPerIp
+        self._maxPendingHellos = maxPendingHellos
+        self.connections = 0
+        self._connectionsByHost = {}
+        self._pendingByHost = {}
+        # id(protocol) -> counted host, and ids of those yet to log in
+        self._hosts = {}
+        self._awaitingHello = set()
+
+    def admits(self, host) -> bool:
+        if self._maxConnections and self.connections >= self._maxConnections:
+            reason = "connections"
+        elif self._maxPendingHellos and self._pendingByHost.get(host, 0) >= self._maxPendingHellos:
+            reason = "pendingHellos"
+        elif self._maxConnectionsPerIp and self._connectionsByHost.get(host, 0) >= self._maxConnectionsPerIp:
+            reason = "perIp"
+        else:
+            return True
+        self._metrics.countRefused(reason)
+        logging.debug(f"Refused a connection from {host}: too many {reason}.")
+        return False
+
+    def admit(self, watcherProtocol, host, awaitingHello: bool = True) -> None:
+        self.connections += 1
+        if host is not None:
+            self._connectionsByHost[host] = self._connectionsByHost.get(host, 0) + 1
+            self._hosts[id(watcherProtocol)] = host
+        if awaitingHello:
+            self._awaitingHello.add(id(watcherProtocol))
+            if host is not None:
+                self._pendingByHost[host] = self._pendingByHost.get(host, 0) + 1
+            self._metrics.pendingHellos = len(self._awaitingHello)
+
+    def helloReceived(self, watcherProtocol) -> None:
+        if id(watcherProtocol) not in self._awaitingHello:
+            return
+        self._awaitingHello.remove(id(watcherProtocol))
+        self._metrics.pendingHellos = len(self._awaitingHello)
+        host = self._hosts.get(id(watcherProtocol))
+        if host is not None:
+            self._decrement(self._pendingByHost, host)
+
+    def release(self, watcherProtocol) -> None:
+        self.helloReceived(watcherProtocol)
+        self.connections -= 1
+        host = self._hosts.pop(id(watcherProtocol), None)
+        if host is not None:
+            self._decrement(self._connectionsByHost, host)
+
+    @staticmethod
+    def _decrement(counts: dict, host) -> None:
+        remaining = counts[host] - 1
+        if remaining:
+            counts[host] = remaining
+        else:
+            del counts[host]
+
+
+class MotdTemplate:
+    """The MOTD file, compiled once and re-read only when it changes.
+
+    The file is stat'ed at most once per MOTD_CHECK_INTERVAL; a new inode
+    (e.g. a swapped ConfigMap mount), mtime or size triggers a reload.
+    Templates that do not use per-user placeholders are rendered once per
+    room and version warning.
+    """
+    PER_USER_PLACEHOLDERS = frozenset(("userIp", "username"))
+
+    def __init__(self, path: str):
+        self._path = path
+        self._template = None
+        self._identity = None
+        self._lastCheck = None
+        self._cacheable = False
+        self._renders = {}
+
+    def _refresh(self) -> None:
+        now = time.monotonic()
+        if self._lastCheck is not None and now - self._lastCheck < constants.MOTD_CHECK_INTERVAL:
+            return
+        self._lastCheck = now
+        try:
+            stat = os.stat(self._path)
+        except OSError:
+            self._template = self._identity = None
+            return
+        identity = (stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if identity == self._identity:
+            return
+        try:
+            with codecs.open(self._path, "r", "utf-8-sig") as motdFile:
+                text = motdFile.read()
+        except (OSError, ValueError):
+            self._template = self._identity = None
+            return
+        self._identity = identity
+        self._template = Template(text)
+        placeholders = set()
+        for match in Template.pattern.finditer(text):
+            placeholders.add(match.group("named") or match.group("braced"))
+        self._cacheable = not (placeholders & self.PER_USER_PLACEHOLDERS)
+        self._renders.clear()
+
+    def render(self, userIp, username: str, room, warning):
+        # None when there is no usable MOTD file
+        self._refresh()
+        if self._template is None:
+            return None
+        key = None
+        if self._cacheable:
+            key = (str(room), warning)
+            motd = self._renders.get(key)
+            if motd is not None:
+                return motd
+        motd = self._substitute({"version": syncplay.version, "userIp": userIp, "username": username, "room": room}, warning)
+        if key is not None:
+            if len(self._renders) >= constants.MOTD_CACHE_SIZE:
+                self._renders.clear()
+            self._renders[key] = motd
+        return motd
+
+    def _substitute(self, args: dict, warning) -> str:
+        try:
+            motd = self._template.substitute(args)
+        except ValueError:
+            return getMessage("server-messed-up-motd-unescaped-placeholders")
+        if warning:
+            motd = f"{warning}\n{motd}"
+        if len(motd) < constants.SERVER_MAX_TEMPLATE_LENGTH:
+            return motd
+        return getMessage("server-messed-up-motd-too-long").format(constants.SERVER_MAX_TEMPLATE_LENGTH, len(motd))
 
 
 class StatsRecorder:
     _dbHandle: 'DBManager'
     _roomManagerHandle: 'RoomManager'
 
-    def __init__(self, dbHandle: 'DBManager', roomManager: 'RoomManager'):
+    def __init__(self, dbHandle: 'DBManager', roomManager: 'RoomManager', metrics):
         self._dbHandle = dbHandle
         self._roomManagerHandle = roomManager
+        self._metrics = metrics
 
     def startRecorder(self, delay) -> None:
         try:
             self._dbHandle.connect()
-            reactor.callLater(delay, self._scheduleClientSnapshot)
-        except:
+            # Snapshots are taken delay seconds past every full interval, at
+            # the same times in all workers, so their counts add up
+            self._delay = delay
+            interval = constants.SERVER_STATS_SNAPSHOT_INTERVAL
+            reactor.callLater((delay - time.time()) % interval, self._scheduleClientSnapshot)
+        except Exception as e:
+            logging.debug(e)
             logging.error("Failed to initialize stats database. Server Stats not enabled.")
 
     def _scheduleClientSnapshot(self) -> None:
@@ -304,20 +676,39 @@ class StatsRecorder:
 
     def _runClientSnapshot(self) -> None:
         try:
-            snapshotTime = int(time.time())
+            interval = constants.SERVER_STATS_SNAPSHOT_INTERVAL
+            snapshotTime = round((time.time() - self._delay) / interval) * interval + self._delay
             rooms = self._roomManagerHandle.exportRooms()
-            for room in rooms.values():
-                for watcher in room.watchers:
-                    self._dbHandle.addVersionLog(snapshotTime, watcher.version)
-        except:
-            pass
+            versions = collections.Counter(watcher.version for room in rooms.values() for watcher in room.watchers)
+        except Exception:
+            self._snapshotFailed(None)
+            return
+        if versions:
+            d = self._dbHandle.addVersionLogs(snapshotTime, versions)
+            d.addErrback(self._snapshotFailed)
+        d = self._dbHandle.applyRetention(snapshotTime)
+        d.addErrback(self._retentionFailed)
+
+    def _retentionFailed(self, failure) -> None:
+        self._metrics.statsSnapshotFailures += 1
+        logging.error(f"Failed to apply retention to the stats database: {failure.getErrorMessage()}")
+
+    def _snapshotFailed(self, failure) -> None:
+        self._metrics.statsSnapshotFailures += 1
+        if failure is None:
+            logging.exception("Failed to take a client snapshot for the stats database.")
+        else:
+            logging.error(f"Failed to write a client snapshot to the stats database: {failure.getErrorMessage()}")
 
 
 class DBManager:
     _dbPath: str
 
-    def __init__(self, dbpath: str):
+    def __init__(self, dbpath: str, retentionDays: int = constants.STATS_RAW_RETENTION_DAYS,
+                 hourlyRetentionDays: int = constants.STATS_HOURLY_RETENTION_DAYS):
         self._dbPath = dbpath
+        self._retentionDays = retentionDays
+        self._hourlyRetentionDays = hourlyRetentionDays
         self._connection = None
 
     def __del__(self) -> None:
@@ -325,23 +716,33 @@ class DBManager:
             self._connection.close()
 
     def connect(self) -> None:
-        self._connection = adbapi.ConnectionPool("sqlite3", self._dbPath, check_same_thread=False)
-        self._createSchema()
+        # Migrations run once, before the pool hands out connections
+        statsdb.openDatabase(self._dbPath).close()
+        # A single connection keeps writes serialised
+        self._connection = adbapi.ConnectionPool("sqlite3", self._dbPath, check_same_thread=False,
+                                                 cp_min=1, cp_max=1, cp_openfun=statsdb.configureConnection)
 
-    def _createSchema(self) -> None:
-        initQuery = 'CREATE TABLE IF NOT EXISTS clients_snapshots (snapshot_time integer, version string)'
-        self._connection.runQuery(initQuery)
+    def addVersionLogs(self, timestamp, versions: dict):
+        # One transaction, and one trip to the pool thread, per snapshot
+        return self._connection.runInteraction(statsdb.recordSnapshot, timestamp, versions)
 
-    def addVersionLog(self, timestamp, version) -> None:
-        content = (timestamp, version, )
-        self._connection.runQuery("INSERT INTO clients_snapshots VALUES (?, ?)", content)
+    def applyRetention(self, now: int):
+        return self._connection.runWithConnection(statsdb.applyRetention, now, self._retentionDays, self._hourlyRetentionDays)
 
 
 class RoomManager:
     # _rooms: Dict[str, Room]
+    # _watchersByName: Dict[str, Watcher], keyed by case-folded name
+    # _nameSuffixHints: Dict[str, int], underscores last handed out per name
+    # _reservedNames: Container[str], case-folded names in use on other workers
 
-    def __init__(self):
+    def __init__(self, codec, metrics):
+        self._codec = codec
+        self._metrics = metrics
         self._rooms = {}
+        self._watchersByName = {}
+        self._nameSuffixHints = {}
+        self._reservedNames = {}
 
     def broadcastRoom(self, sender: 'Watcher', whatLambda) -> None:
         room = sender.room
@@ -349,27 +750,62 @@ class RoomManager:
             for receiver in room.watchers:
                 whatLambda(receiver)
 
-    def broadcast(self, sender: 'Watcher', whatLambda) -> None:
-        for room in self._rooms.values():
-            for receiver in room.watchers:
-                whatLambda(receiver)
+    def broadcastRoomEncoded(self, sender: 'Watcher', line: bytes, receiverFilter=None) -> None:
+        room = sender.room
+        if room and room.name in self._rooms:
+            self._sendEncoded(room.watchers, line, receiverFilter)
+
+    def broadcastEncoded(self, sender: 'Watcher', line: bytes, receiverFilter=None) -> None:
+        self._sendEncoded(self._watchersByName.values(), line, receiverFilter)
 
-    def getAllWatchersForUser(self, sender: 'Watcher') -> list:
-        watchers = []
-        for room in self._rooms.values():
-            watchers.extend(room.watchers)
-        return watchers
+    def _sendEncoded(self, receivers, line: bytes, receiverFilter) -> None:
+        sent = 0
+        for receiver in receivers:
+            if receiverFilter is None or receiverFilter(receiver):
+                receiver.sendEncodedMessage(line)
+                sent += 1
+        self._metrics.countBroadcast(line, sent)
+
+    def getAllWatchersForUser(self, sender: 'Watcher'):
+        return self._watchersByName.values()
+
+    def updateInterest(self, watcher: 'Watcher') -> None:
+        pass
+
+    def encodeUserList(self, sender: 'Watcher', remoteRosters=()) -> bytes:
+        return self._encodeList(self._rooms.values(), remoteRosters)
+
+    def encodeRosters(self) -> list:
+        # Every room keeps its part of the message encoded until it changes
+        return [room.encodeRoster(self._codec) for room in self._rooms.values() if room.size]
+
+    def _encodeList(self, rooms, remoteRosters=()) -> bytes:
+        fragments = [room.encodeRoster(self._codec) for room in rooms if room.size]
+        fragments.extend(remoteRosters)
+        return b'{"List": {' + b', '.join(fragments) + b'}}'
 
     def moveWatcher(self, watcher: 'Watcher', roomName: str) -> None:
         roomName = truncateText(roomName, constants.MAX_ROOM_NAME_LENGTH)
-        self.removeWatcher(watcher)
+        self._leaveRoom(watcher)
         room = self._getRoom(roomName)
+        size = room.size
         room.addWatcher(watcher)
+        self._metrics.roomResized(size, room.size)
+        self._watchersByName[watcher.name.lower()] = watcher
 
     def removeWatcher(self, watcher: 'Watcher') -> None:
+        self._leaveRoom(watcher)
+        key = watcher.name.lower()
+        if self._watchersByName.get(key) is watcher:
+            del self._watchersByName[key]
+            self._nameSuffixHints.pop(key, None)
+
+    def _leaveRoom(self, watcher: 'Watcher') -> None:
         oldRoom = watcher.room
         if oldRoom:
+            size = oldRoom.size
             oldRoom.removeWatcher(watcher)
+            self._metrics.roomResized(size, oldRoom.size)
             self._deleteRoomIfEmpty(oldRoom)
 
     def _getRoom(self, roomName: str) -> 'Room':
@@ -384,38 +820,166 @@ class RoomManager:
         if room.isEmpty() and room.name in self._rooms:
             del self._rooms[room.name]
 
+    def setReservedNames(self, names) -> None:
+        self._reservedNames = names
+
+    def isUsernameTaken(self, username: str) -> bool:
+        key = username.lower()
+        return key in self._watchersByName or key in self._reservedNames
+
     def findFreeUsername(self, username: str) -> str:
         username = truncateText(username, constants.MAX_USERNAME_LENGTH)
-        allnames = set()
-        for room in self._rooms.values():
-            _watchers = map(lambda w: w.name.lower(), room.watchers)
-            allnames.update(_watchers)
-        while username.lower() in allnames:
-            username += '_'
-        return username
+        if not self.isUsernameTaken(username):
+            return username
+        # Resume from the last suffix handed out for this name instead of
+        # probing every taken variant again during reconnect storms
+        key = username.lower()
+        suffixes = self._nameSuffixHints.get(key, 0) + 1
+        while self.isUsernameTaken(key + '_' * suffixes):
+            suffixes += 1
+        self._nameSuffixHints[key] = suffixes
+        return username + '_' * suffixes
 
     def exportRooms(self) -> dict:
         return self._rooms
 
 
 class PublicRoomManager(RoomManager):
-    def broadcast(self, sender: 'Watcher', what) -> None:
-        self.broadcastRoom(sender, what)
+    def broadcastEncoded(self, sender: 'Watcher', line: bytes, receiverFilter=None) -> None:
+        self.broadcastRoomEncoded(sender, line, receiverFilter)
 
     def getAllWatchersForUser(self, sender: 'Watcher'):
         return sender.room.watchers
 
+    def encodeUserList(self, sender: 'Watcher', remoteRosters=()) -> bytes:
+        return self._encodeList((sender.room,) if sender.room else ())
+
     def moveWatcher(self, watcher: 'Watcher', room: str) -> None:
         oldRoom = watcher.room
-        l = lambda w: w.sendSetting(watcher.name, oldRoom, None, {"left": True})
-        self.broadcast(watcher, l)
+        if oldRoom:
+            message = SyncServerProtocol.userSettingMessage(watcher.name, oldRoom, None, {"left": True})
+            self.broadcastEncoded(watcher, self._codec.dumps(message))
         RoomManager.moveWatcher(self, watcher, room)
         watcher.setFile(watcher.file)
 
 
+class InterestRoomManager(RoomManager):
+    """Non-isolated rooms where events from other rooms only go to the
+    watchers that want them: those whose client asked for them with the
+    allRoomEvents feature and those that sent a List request during the
+    last ROOM_INTEREST_WINDOW seconds. Everyone else only hears about
+    their own room, so a busy server no longer sends every join, leave and
+    file change to every user.
+    """
+
+    def __init__(self, codec, metrics):
+        super().__init__(codec, metrics)
+        # Interested watcher -> time its interest runs out, None for opted in
+        self._listeners = {}
+
+    def broadcastEncoded(self, sender: 'Watcher', line: bytes, receiverFilter=None) -> None:
+        # Events relayed from other workers have no sender and no room here
+        room = sender.room if sender is not None else None
+        receivers = list(room.watchers) if room and room.name in self._rooms else []
+        now = time.monotonic()
+        expired = []
+        for watcher, expiry in self._listeners.items():
+            if expiry is not None and expiry < now:
+                expired.append(watcher)
+            elif watcher.room is not room:
+                receivers.append(watcher)
+        for watcher in expired:
+            del self._listeners[watcher]
+        self._sendEncoded(receivers, line, receiverFilter)
+
+    def encodeUserList(self, sender: 'Watcher', remoteRosters=()) -> bytes:
+        if self._listeners.get(sender, 0) is not None:
+            self._listeners[sender] = time.monotonic() + constants.ROOM_INTEREST_WINDOW
+        return super().encodeUserList(sender, remoteRosters)
+
+    def updateInterest(self, watcher: 'Watcher') -> None:
+        if watcher.getFeatures().get("allRoomEvents"):
+            self._listeners[watcher] = None
+        elif watcher in self._listeners and self._listeners[watcher] is None:
+            del self._listeners[watcher]
+
+    def moveWatcher(self, watcher: 'Watcher', roomName: str) -> None:
+        oldRoom = watcher.room
+        if oldRoom:
+            # The room switch message only reaches the new room
+            message = SyncServerProtocol.userSettingMessage(watcher.name, oldRoom, None, {"left": True})
+            self._sendEncoded(
+                [receiver for receiver in oldRoom.watchers if receiver not in self._listeners],
+                self._codec.dumps(message), None)
+        RoomManager.moveWatcher(self, watcher, roomName)
+        self.updateInterest(watcher)
+        watcher.setFile(watcher.file)
+
+    def removeWatcher(self, watcher: 'Watcher') -> None:
+        RoomManager.removeWatcher(self, watcher)
+        self._listeners.pop(watcher, None)
+
+
+class PositionHeap:
+    """Lazily invalidated min-heap of watchers ordered by playback position.
+
+    Watchers are pushed again whenever their position, file or last update
+    time changes; older entries are skipped when the heap is queried. Finding
+    the slowest watcher is therefore O(log n) per update instead of a scan of
+    the whole room on every query.
+    """
+    __slots__ = ("_heap", "_entries", "_sequence", "_playing")
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}
+        self._sequence = itertools.count()
+        self._playing = False
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def update(self, watcher: 'Watcher') -> None:
+        key = watcher.getLeaderKey(self._playing)
+        if key is None:
+            self._entries.pop(watcher, None)
+            return
+        sequence = next(self._sequence)
+        self._entries[watcher] = sequence
+        heapq.heappush(self._heap, (key, sequence, watcher))
+        if len(self._heap) > 2 * len(self._entries) + 16:
+            self._rebuild()
+
+    def discard(self, watcher: 'Watcher') -> None:
+        self._entries.pop(watcher, None)
+
+    def setPlaying(self, playing: bool) -> None:
+        # Keys are only comparable within one play state
+        if playing != self._playing:
+            self._playing = playing
+            self._rebuild()
+
+    def peek(self):
+        heap = self._heap
+        while heap:
+            _, sequence, watcher = heap[0]
+            if self._entries.get(watcher) == sequence:
+                return watcher
+            heapq.heappop(heap)
+        return None
+
+    def _rebuild(self) -> None:
+        self._heap = [(watcher.getLeaderKey(self._playing), sequence, watcher) for watcher, sequence in self._entries.items()]
+        heapq.heapify(self._heap)
+
+
 class Room:
     STATE_PAUSED = 0
     STATE_PLAYING = 1
+    __slots__ = (
+        "_name", "_watchers", "_playState", "_setBy", "_playlist", "_playlistIndex", "_lastUpdate",
+        "_position", "_snapshot", "_snapshotTurn", "_positions", "_watchersView", "_roster",
+    )
 
     _name: str
     # _watchers: Dict[str, Watcher]
@@ -425,6 +989,10 @@ class Room:
     # _playlistIndex: Optional[int]
     _lastUpdate: float
     # _position: Union[int, float]
+    # _snapshot: Optional[Tuple[position, paused, setBy, takenAt]]
+    # _snapshotTurn: Optional[int]
+    # _watchersView: Optional[Tuple[Watcher, ...]]
+    # _roster: Optional[bytes], this room's encoded entry of a List message
 
     def __init__(self, name: str):
         self._name = name
@@ -435,6 +1003,11 @@ class Room:
         self._playlistIndex = None
         self._lastUpdate = time.time()
         self._position = 0
+        self._snapshot = None
+        self._snapshotTurn = None
+        self._positions = PositionHeap()
+        self._watchersView = ()
+        self._roster = None
 
     def __str__(self, *args, **kwargs) -> str:
         return self.name
@@ -446,7 +1019,7 @@ class Room:
     def getPosition(self):
         age = time.time() - self._lastUpdate
         if self._watchers and age > 1:
-            watcher = min(self._watchers.values())
+            watcher = self._positions.peek() or next(iter(self._watchers.values()))
             self._setBy = watcher
             self._position = watcher.getPosition()
             self._lastUpdate = time.time()
@@ -459,13 +1032,34 @@ class Room:
         else:
             return 0
 
+    def getStateSnapshot(self, turn=None) -> tuple:
+        # Every member served during the same scheduler turn shares one result,
+        # moved on by the time since it was taken while the room is playing
+        if turn is not None and turn == self._snapshotTurn:
+            position, paused, setBy, takenAt = self._snapshot
+            if not paused:
+                position += time.time() - takenAt
+            return position, paused, setBy
+        position = self.getPosition()
+        paused = self.isPaused()
+        if turn is not None:
+            self._snapshot = (position, paused, self._setBy, time.time())
+            self._snapshotTurn = turn
+        return position, paused, self._setBy
+
+    def _invalidateSnapshot(self) -> None:
+        self._snapshotTurn = None
+
     def setPaused(self, paused=STATE_PAUSED, setBy=None) -> None:
         self._playState = paused
         self._setBy = setBy
+        self._invalidateSnapshot()
+        self._positions.setPlaying(self.isPlaying())
 
     def setPosition(self, position, setBy=None) -> None:
         self._position = position
         self._setBy = setBy
+        self._invalidateSnapshot()
         for watcher in self._watchers.values():
             watcher.setPosition(position)
 
@@ -476,19 +1070,30 @@ class Room:
         return self._playState == self.STATE_PAUSED
 
     @property
-    def watchers(self) -> list:
-        return list(self._watchers.values())
+    def watchers(self) -> tuple:
+        # Immutable snapshot shared by every reader until membership changes
+        if self._watchersView is None:
+            self._watchersView = tuple(self._watchers.values())
+        return self._watchersView
 
     def addWatcher(self, watcher: 'Watcher') -> None:
         if self._watchers:
             watcher.setPosition(self.getPosition())
         self._watchers[watcher.name] = watcher
+        self._watchersView = None
+        self._roster = None
+        self._invalidateSnapshot()
         watcher.room = self
+        self._positions.update(watcher)
 
     def removeWatcher(self, watcher: 'Watcher') -> None:
         if watcher.name not in self._watchers:
             return
         del self._watchers[watcher.name]
+        self._watchersView = None
+        self._roster = None
+        self._invalidateSnapshot()
+        self._positions.discard(watcher)
         watcher.room = None
         if not self._watchers:
             self._position = 0
@@ -496,6 +1101,33 @@ class Room:
     def isEmpty(self) -> bool:
         return not bool(self._watchers)
 
+    @property
+    def size(self) -> int:
+        return len(self._watchers)
+
+    def watcherUpdated(self, watcher: 'Watcher') -> None:
+        self._positions.update(watcher)
+
+    def invalidateRoster(self) -> None:
+        self._roster = None
+
+    def encodeRoster(self, codec) -> bytes:
+        # Positions are not part of the list, so only membership, files,
+        # readiness, control and features invalidate it
+        if self._roster is None:
+            users = {
+                watcher.name: {
+                    "position": 0,
+                    "file": watcher.file if watcher.file else {},
+                    "controller": watcher.isController(),
+                    "isReady": watcher.isReady(),
+                    "features": watcher.getFeatures()
+                }
+                for watcher in self._watchers.values()
+            }
+            self._roster = codec.dumps(self._name) + b': ' + codec.dumps(users)
+        return self._roster
+
     @property
     def setBy(self):
         return self._setBy
@@ -529,16 +1161,18 @@ class Room:
 
 
 class ControlledRoom(Room):
+    __slots__ = ("_controllers", "_controllerPositions")
     # _controllers: Dict[str, Watcher]
 
     def __init__(self, name: str):
         super().__init__(name)
         self._controllers = {}
+        self._controllerPositions = PositionHeap()
 
     def getPosition(self):
         age = time.time() - self._lastUpdate
         if self._controllers and age > 1:
-            watcher = min(self._controllers.values())
+            watcher = self._controllerPositions.peek() or next(iter(self._controllers.values()))
             self._setBy = watcher
             self._position = watcher.position
             self._lastUpdate = time.time()
@@ -553,15 +1187,24 @@ class ControlledRoom(Room):
 
     def addController(self, watcher: 'Watcher') -> None:
         self._controllers[watcher.name] = watcher
+        self._controllerPositions.update(watcher)
+        self._roster = None
 
     def removeWatcher(self, watcher: 'Watcher') -> None:
         Room.removeWatcher(self, watcher)
         if watcher.name in self._controllers:
             del self._controllers[watcher.name]
+            self._controllerPositions.discard(watcher)
+
+    def watcherUpdated(self, watcher: 'Watcher') -> None:
+        Room.watcherUpdated(self, watcher)
+        if self._controllers.get(watcher.name) is watcher:
+            self._controllerPositions.update(watcher)
 
     def setPaused(self, paused=Room.STATE_PAUSED, setBy=None) -> None:
         if self.canControl(setBy):
             Room.setPaused(self, paused, setBy)
+            self._controllerPositions.setPlaying(self.isPlaying())
 
     def setPosition(self, position, setBy=None) -> None:
         if self.canControl(setBy):
@@ -584,6 +1227,9 @@ class ControlledRoom(Room):
 
 
 class Watcher:
+    __slots__ = (
+        "_ready", "_server", "_connector", "_name", "_room", "_file", "_position", "_lastUpdatedOn", "_capabilities",
+    )
     _server: SyncFactory
     _name: str
     _lastUpdatedOn: float
@@ -597,14 +1243,15 @@ class Watcher:
         self._file = None
         self._position = None
         self._lastUpdatedOn = time.time()
-        self._sendStateTimer = None
+        self._capabilities = connector.getCapabilities()
         self._connector.setWatcher(self)
-        reactor.callLater(0.1, self._scheduleSendState)
 
     def setFile(self, file_) -> None:
         if file_ and "name" in file_:
             file_["name"] = truncateText(file_["name"], constants.MAX_FILENAME_LENGTH)
         self._file = file_
+        self._notifyRoom()
+        self.rosterChanged()
         self._server.sendFileUpdate(self)
 
     @property
@@ -616,6 +1263,7 @@ class Watcher:
     @ready.setter
     def ready(self, ready) -> None:
         self._ready = ready
+        self.rosterChanged()
 
     def isReady(self):
         # compatibility wrapper for property
@@ -641,19 +1289,31 @@ class Watcher:
     def room(self, room) -> None:
         self._room = room
         if room is None:
-            self._deactivateStateTimer()
+            self._server.cancelStateUpdates(self)
         else:
-            self._resetStateTimer()
+            self._server.scheduleStateUpdates(self)
             self._askForStateUpdate(True, True)
 
     @property
     def name(self):
         return self._name
 
+    @property
+    def lastUpdatedOn(self) -> float:
+        return self._lastUpdatedOn
+
     @property
     def version(self):
         return self._connector.getVersion()
 
+    @property
+    def capabilities(self) -> int:
+        return self._capabilities
+
+    @property
+    def connector(self):
+        return self._connector
+
     @property
     def file(self):
         return self._file
@@ -675,6 +1335,24 @@ class Watcher:
     @position.setter
     def position(self, position) -> None:
         self._position = position
+        self._notifyRoom()
+
+    def getLeaderKey(self, playing: bool):
+        # Position extrapolated back to the epoch while playing, so the key
+        # orders watchers correctly without changing as time passes
+        if self._position is None or self._file is None:
+            return None
+        if playing:
+            return self._position - self._lastUpdatedOn
+        return self._position
+
+    def _notifyRoom(self) -> None:
+        if self._room is not None:
+            self._room.watcherUpdated(self)
+
+    def rosterChanged(self) -> None:
+        if self._room is not None:
+            self._room.invalidateRoster()
 
     def getPosition(self):
         # compatibility wrapper for property
@@ -693,9 +1371,8 @@ class Watcher:
     def sendControlledRoomAuthStatus(self, success, username: str, room: str) -> None:
         self._connector.sendControlledRoomAuthStatus(success, username, room)
 
-    def sendChatMessage(self, message) -> None:
-        if self._connector.meetsMinVersion(constants.CHAT_MIN_VERSION):
-            self._connector.sendMessage({"Chat": message})
+    def sendEncodedMessage(self, line: bytes) -> None:
+        self._connector.sendEncodedMessage(line)
 
     def sendSetReady(self, username, isReady, manuallyInitiated: bool = True) -> None:
         self._connector.sendSetReady(username, isReady, manuallyInitiated)
@@ -713,29 +1390,12 @@ class Watcher:
             return True
         return self.position < b.position
 
-    def _scheduleSendState(self) -> None:
-        self._sendStateTimer = task.LoopingCall(self._askForStateUpdate)
-        self._sendStateTimer.start(constants.SERVER_STATE_INTERVAL)
-
     def _askForStateUpdate(self, doSeek: bool = False, forcedUpdate: bool = False) -> None:
         self._server.sendState(self, doSeek, forcedUpdate)
 
-    def _resetStateTimer(self) -> None:
-        if self._sendStateTimer:
-            if self._sendStateTimer.running:
-                self._sendStateTimer.stop()
-            self._sendStateTimer.start(constants.SERVER_STATE_INTERVAL)
-
-    def _deactivateStateTimer(self) -> None:
-        if self._sendStateTimer and self._sendStateTimer.running:
-            self._sendStateTimer.stop()
-
     def sendState(self, position, paused, doSeek, setBy, forcedUpdate: bool) -> None:
         if self._connector.isLogged():
             self._connector.sendState(position, paused, doSeek, setBy, forcedUpdate)
-        if time.time() - self._lastUpdatedOn > constants.PROTOCOL_TIMEOUT:
-            self._server.removeWatcher(self)
-            self._connector.drop()
 
     def __hasPauseChanged(self, paused) -> bool:
         if paused is None:
@@ -755,6 +1415,8 @@ class Watcher:
         if position is not None:
             position = self._updatePositionByAge(messageAge, paused, position)
             self.setPosition(position)
+        else:
+            self._notifyRoom()
         if doSeek or pauseChanged:
             self._server.forcePositionUpdate(self, doSeek, paused)
 
@@ -0,0 +1,262 @@
+"""Schema, maintenance and queries of the server stats database.
+
+Every snapshot is stored as one raw row per client (clients_snapshots, the
+original table) and folded into hourly and daily rollups as it is written.
+Raw rows and hourly rollups are only kept for a limited time, daily rollups
+are kept forever; they stay small enough to answer questions about years of
+data instantly.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+
+from syncplay import constants
+from syncplay.messages import getMessage
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+# MIGRATIONS[n] upgrades a database from user_version n to n + 1
+MIGRATIONS = (
+    '''
+    CREATE TABLE IF NOT EXISTS clients_snapshots (snapshot_time integer, version string);
+    CREATE INDEX IF NOT EXISTS clients_snapshots_time ON clients_snapshots (snapshot_time);
+    CREATE INDEX IF NOT EXISTS clients_snapshots_version ON clients_snapshots (version);
+    ''',
+    f'''
+    CREATE TABLE hourly_versions (
+        hour integer, version text, clients integer,
+        PRIMARY KEY (hour, version)
+    ) WITHOUT ROWID;
+    CREATE TABLE hourly_totals (hour integer PRIMARY KEY, clients integer);
+    CREATE TABLE daily_versions (
+        day integer, version text, clients_sum integer, clients_max integer,
+        PRIMARY KEY (day, version)
+    ) WITHOUT ROWID;
+    CREATE TABLE daily_totals (day integer PRIMARY KEY, snapshots integer, clients_sum integer, clients_max integer);
+    CREATE INDEX daily_versions_version ON daily_versions (version);
+
+    -- Fold in everything recorded before the rollups existed
+    CREATE TEMP TABLE snapshot_versions AS
+        SELECT snapshot_time, version, count(*) AS clients FROM clients_snapshots GROUP BY snapshot_time, version;
+    CREATE TEMP TABLE snapshot_totals AS
+        SELECT snapshot_time, sum(clients) AS clients FROM snapshot_versions GROUP BY snapshot_time;
+    INSERT INTO hourly_versions
+        SELECT snapshot_time - snapshot_time % {HOUR} AS hour, version, max(clients)
+        FROM snapshot_versions GROUP BY hour, version;
+    INSERT INTO hourly_totals
+        SELECT snapshot_time - snapshot_time % {HOUR} AS hour, max(clients) FROM snapshot_totals GROUP BY hour;
+    INSERT INTO daily_versions
+        SELECT snapshot_time - snapshot_time % {DAY} AS day, version, sum(clients), max(clients)
+        FROM snapshot_versions GROUP BY day, version;
+    INSERT INTO daily_totals
+        SELECT snapshot_time - snapshot_time % {DAY} AS day, count(*), sum(clients), max(clients)
+        FROM snapshot_totals GROUP BY day;
+    DROP TABLE snapshot_versions;
+    DROP TABLE snapshot_totals;
+    ''',
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def configureConnection(connection) -> None:
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+
+
+def _statements(script: str):
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ""
+
+
+def migrate(connection) -> int:
+    current = connection.execute('PRAGMA user_version').fetchone()[0]
+    if current > SCHEMA_VERSION:
+        raise RuntimeError(f"Stats database schema {current} is newer than this server ({SCHEMA_VERSION})")
+    if current == SCHEMA_VERSION:
+        return current
+    # Workers may open a fresh database at the same time: the version is
+    # read again with the write lock held, so only the first one migrates it
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        current = connection.execute('PRAGMA user_version').fetchone()[0]
+        for version in range(current, SCHEMA_VERSION):
+            for statement in _statements(MIGRATIONS[version]):
+                connection.execute(statement)
+            connection.execute(f'PRAGMA user_version = {version + 1}')
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    return current
+
+
+def openDatabase(path: str):
+    connection = sqlite3.connect(path)
+    configureConnection(connection)
+    migrate(connection)
+    return connection
+
+
+def recordSnapshot(cursor, timestamp: int, versions: dict) -> None:
+    """Record the clients seen at timestamp.
+
+    With several workers each records the clients it serves, at the same
+    timestamps. The raw rows hold what has been recorded for a timestamp so
+    far, so the rollups add up the parts and take peaks from the running
+    totals, and a snapshot is only counted once.
+    """
+    hour = timestamp - timestamp % HOUR
+    day = timestamp - timestamp % DAY
+    # The other workers' parts must not land between the reads and writes below
+    cursor.execute('BEGIN IMMEDIATE')
+    first = cursor.execute('SELECT 1 FROM clients_snapshots WHERE snapshot_time = ? LIMIT 1', (timestamp,)).fetchone() is None
+    # The raw table keeps one row per client
+    rows = ((timestamp, version) for version, count in versions.items() for _ in range(count))
+    cursor.executemany('INSERT INTO clients_snapshots VALUES (?, ?)', rows)
+    recorded = dict(cursor.execute(
+        'SELECT version, count(*) FROM clients_snapshots WHERE snapshot_time = ? GROUP BY version', (timestamp,)))
+    total = sum(recorded.values())
+    # A restarted server may snapshot twice in one hour: keep the larger one
+    cursor.executemany('''
+        INSERT INTO hourly_versions VALUES (?, ?, ?)
+        ON CONFLICT (hour, version) DO UPDATE SET clients = max(clients, excluded.clients)
+    ''', [(hour, version, recorded[version]) for version in versions])
+    cursor.execute('''
+        INSERT INTO hourly_totals VALUES (?, ?)
+        ON CONFLICT (hour) DO UPDATE SET clients = max(clients, excluded.clients)
+    ''', (hour, total))
+    cursor.executemany('''
+        INSERT INTO daily_versions VALUES (?, ?, ?, ?)
+        ON CONFLICT (day, version) DO UPDATE SET
+            clients_sum = clients_sum + excluded.clients_sum,
+            clients_max = max(clients_max, excluded.clients_max)
+    ''', [(day, version, count, recorded[version]) for version, count in versions.items()])
+    cursor.execute('''
+        INSERT INTO daily_totals VALUES (?, ?, ?, ?)
+        ON CONFLICT (day) DO UPDATE SET
+            snapshots = snapshots + excluded.snapshots,
+            clients_sum = clients_sum + excluded.clients_sum,
+            clients_max = max(clients_max, excluded.clients_max)
+    ''', (day, int(first), sum(versions.values()), total))
+
+
+def applyRetention(connection, now: int, rawDays: int, hourlyDays: int) -> dict:
+    """Drop raw rows and hourly rollups past their retention (0 keeps them)
+    and compact the file once enough of it is free pages.
+    """
+    result = {"raw": 0, "hourly": 0}
+    cursor = connection.cursor()
+    try:
+        if rawDays:
+            cursor.execute('DELETE FROM clients_snapshots WHERE snapshot_time < ?', (now - rawDays * DAY,))
+            result["raw"] = cursor.rowcount
+        if hourlyDays:
+            cutoff = now - hourlyDays * DAY
+            cursor.execute('DELETE FROM hourly_versions WHERE hour < ?', (cutoff,))
+            result["hourly"] = cursor.rowcount
+            cursor.execute('DELETE FROM hourly_totals WHERE hour < ?', (cutoff,))
+        connection.commit()
+    except sqlite3.Error:
+        connection.rollback()
+        raise
+    pages = cursor.execute('PRAGMA page_count').fetchone()[0]
+    free = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+    result["compacted"] = bool(pages and free / pages > constants.STATS_COMPACTION_FREE_RATIO)
+    if result["compacted"]:
+        cursor.execute('VACUUM')
+    return result
+
+
+def versionDistribution(connection, since: int) -> list:
+    day = since - since % DAY
+    snapshots = connection.execute(
+        'SELECT coalesce(sum(snapshots), 0) FROM daily_totals WHERE day >= ?', (day,)).fetchone()[0]
+    rows = connection.execute('''
+        SELECT version, sum(clients_sum), max(clients_max) FROM daily_versions
+        WHERE day >= ? GROUP BY version ORDER BY sum(clients_sum) DESC
+    ''', (day,)).fetchall()
+    total = sum(row[1] for row in rows)
+    return [{
+        "version": version,
+        "averageClients": clientsSum / snapshots if snapshots else 0,
+        "peakClients": peak,
+        "share": clientsSum / total if total else 0,
+    } for version, clientsSum, peak in rows]
+
+
+def concurrency(connection, since: int, hourly: bool = False) -> list:
+    if hourly:
+        rows = connection.execute(
+            'SELECT hour, clients FROM hourly_totals WHERE hour >= ? ORDER BY hour', (since - since % HOUR,))
+        return [{"time": hour, "clients": clients} for hour, clients in rows]
+    rows = connection.execute('''
+        SELECT day, snapshots, clients_sum, clients_max FROM daily_totals WHERE day >= ? ORDER BY day
+    ''', (since - since % DAY,))
+    return [{
+        "time": day,
+        "averageClients": clientsSum / snapshots if snapshots else 0,
+        "peakClients": peak,
+    } for day, snapshots, clientsSum, peak in rows]
+
+
+def _formatTime(timestamp: int, hourly: bool) -> str:
+    return time.strftime('%Y-%m-%d %H:00' if hourly else '%Y-%m-%d', time.gmtime(timestamp))
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="syncplay-server stats", description=getMessage("server-stats-description"))
+    parser.add_argument('--stats-db-file', metavar='file', default=os.environ.get('SYNCPLAY_STATS_DB_FILE'),
+                        help=getMessage("server-stats-db-file-argument"))
+    parser.add_argument('--json', action='store_true', help=getMessage("server-stats-json-argument"))
+    commands = parser.add_subparsers(dest='command', required=True)
+    versions = commands.add_parser('versions', help=getMessage("server-stats-versions-argument"))
+    versions.add_argument('--days', type=int, default=30, help=getMessage("server-stats-days-argument"))
+    peaks = commands.add_parser('concurrency', help=getMessage("server-stats-concurrency-argument"))
+    peaks.add_argument('--days', type=int, default=30, help=getMessage("server-stats-days-argument"))
+    peaks.add_argument('--hourly', action='store_true', help=getMessage("server-stats-hourly-argument"))
+    maintain = commands.add_parser('maintain', help=getMessage("server-stats-maintain-argument"))
+    maintain.add_argument('--retention-days', type=int, default=constants.STATS_RAW_RETENTION_DAYS,
+                          help=getMessage("server-stats-retention-argument").format(constants.STATS_RAW_RETENTION_DAYS))
+    maintain.add_argument('--hourly-retention-days', type=int, default=constants.STATS_HOURLY_RETENTION_DAYS,
+                          help=getMessage("server-stats-hourly-retention-argument").format(constants.STATS_HOURLY_RETENTION_DAYS))
+    args = parser.parse_args(argv)
+
+    if not args.stats_db_file or not os.path.isfile(args.stats_db_file):
+        parser.error(getMessage("server-stats-no-database-error"))
+    connection = openDatabase(args.stats_db_file)
+    now = int(time.time())
+    if args.command == 'maintain':
+        result = applyRetention(connection, now, args.retention_days, args.hourly_retention_days)
+    elif args.command == 'versions':
+        result = versionDistribution(connection, now - args.days * DAY)
+    else:
+        result = concurrency(connection, now - args.days * DAY, args.hourly)
+    connection.close()
+
+    if args.json or args.command == 'maintain':
+        print(json.dumps(result, indent=2))
+    elif args.command == 'versions':
+        print(f"{'version':<16} {'average':>10} {'peak':>8} {'share':>7}")
+        for row in result:
+            print(f"{row['version']:<16} {row['averageClients']:>10.1f} {row['peakClients']:>8} {row['share']:>7.1%}")
+    elif args.hourly:
+        print(f"{'hour (UTC)':<17} {'clients':>8}")
+        for row in result:
+            print(f"{_formatTime(row['time'], True):<17} {row['clients']:>8}")
+    else:
+        print(f"{'day (UTC)':<11} {'average':>10} {'peak':>8}")
+        for row in result:
+            print(f"{_formatTime(row['time'], False):<11} {row['averageClients']:>10.1f} {row['peakClients']:>8}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
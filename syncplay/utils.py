@@ -1,5 +1,10 @@
+import functools
 import hashlib
 import random
+try:
+    import resource
+except ImportError:
+    resource = None
 import re
 import string
 import time
@@ -62,10 +67,86 @@ def truncateText(unicodeText: Union[bytes, str], maxLength: int) -> str:
     return ""
 
 
-def meetsMinVersion(version: str, minVersion: str) -> bool:
-    def versiontotuple(ver: str) -> tuple:
-        return tuple(map(int, ver.split(".")))
-    return versiontotuple(version) >= versiontotuple(minVersion)
+@functools.lru_cache(maxsize=constants.CLIENT_PROFILE_CACHE_SIZE)
+def parseVersion(version: str) -> tuple:
+    # Parsing stops at the first part that is not a plain number, so
+    # "1.7.0-beta" reads as 1.7.0 and garbage as older than any release
+    parts = []
+    for part in version.split("."):
+        number = re.match(r"\d*", part).group()
+        if not number:
+            break
+        parts.append(int(number))
+        if number != part:
+            break
+    return tuple(parts)
+
+
+class ClientProfile:
+    """Everything derived from a client's version, shared by all clients of that version.
+
+    capabilities holds the CAPABILITY_* bits of constants, so checks made for
+    every receiver of a broadcast are a single bitwise and. features is what
+    the client is assumed to support when it does not send its own list;
+    being shared, it must never be modified.
+    """
+    __slots__ = ("version", "versionTuple", "capabilities", "features")
+
+    def __init__(self, version: str):
+        self.version = version
+        self.versionTuple = parseVersion(version)
+        self.capabilities = 0
+        for capability, minVersion in constants.CAPABILITY_MIN_VERSIONS.items():
+            if self.versionTuple >= parseVersion(minVersion):
+                self.capabilities |= capability
+        self.features = {
+            "sharedPlaylists": self.supports(constants.CAPABILITY_SHARED_PLAYLIST),
+            "chat": self.supports(constants.CAPABILITY_CHAT),
+            "featureList": False,
+            "readiness": self.supports(constants.CAPABILITY_USER_READY),
+            "managedRooms": self.supports(constants.CAPABILITY_CONTROLLED_ROOMS)
+        }
+
+    def supports(self, capability: int) -> bool:
+        return bool(self.capabilities & capability)
+
+
+@functools.lru_cache(maxsize=constants.CLIENT_PROFILE_CACHE_SIZE)
+def getClientProfile(version: str) -> ClientProfile:
+    return ClientProfile(version)
+
+
+_internedFeatures = {}
+
+
+def internFeatures(features: dict) -> dict:
+    # Clients send one of a handful of feature lists, so equal ones share a
+    # single dict. Values are keyed with their type, keeping True and 1 apart
+    try:
+        key = frozenset((name, type(value), value) for name, value in features.items())
+    except TypeError:
+        return features
+    interned = _internedFeatures.get(key)
+    if interned is None:
+        if len(_internedFeatures) >= constants.CLIENT_PROFILE_CACHE_SIZE:
+            return features
+        interned = _internedFeatures[key] = features
+    return interned
+
+
+def raiseFileDescriptorLimit():
+    # Every client needs a descriptor; returns the soft limit now in force,
+    # or None where there is no such limit to speak of
+    if resource is None:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            soft = hard
+        except (ValueError, OSError):
+            pass
+    return None if soft == resource.RLIM_INFINITY else soft
 
 
 def playlistIsValid(files: list) -> bool:
@@ -0,0 +1,440 @@
+import base64
+import itertools
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import zlib
+
+from twisted.internet import defer
+from twisted.internet.interfaces import IFileDescriptorReceiver
+from twisted.internet.protocol import Factory, Protocol, ServerFactory
+from twisted.protocols.basic import LineReceiver
+from zope.interface import implementer
+
+from syncplay import constants
+from syncplay.utils import truncateText
+
+# Nothing in this module may install the reactor at import time: the master
+# process imports it before forking and every worker needs its own reactor.
+
+
+def roomOwner(roomName: str, workers: int) -> int:
+    return zlib.crc32(roomName.encode('utf-8')) % workers
+
+
+def runWorkers(args, serve) -> None:
+    """Fork args.workers server processes and supervise them until they exit.
+
+    Every pair of workers is connected by a UNIX socket, which carries
+    connection handoffs (so all members of a room end up on the worker owning
+    it), the usernames each worker has in use (so they stay unique across the
+    server) and, for non-isolated servers, broadcasts and List requests.
+    """
+    count = args.workers
+    pairs = {}
+    for i in range(count):
+        for j in range(i + 1, count):
+            pairs[(i, j)] = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    children = {}
+    for index in range(count):
+        pid = os.fork()
+        if pid == 0:
+            peers = {}
+            for (i, j), (a, b) in pairs.items():
+                if i == index:
+                    peers[j] = a
+                    b.close()
+                elif j == index:
+                    peers[i] = b
+                    a.close()
+                else:
+                    a.close()
+                    b.close()
+            exitCode = 0
+            try:
+                serve(args, WorkerNode(index, count, peers))
+            except Exception:
+                logging.exception(f"Worker {index} crashed.")
+                exitCode = 1
+            finally:
+                logging.shutdown()
+                os._exit(exitCode)
+        children[pid] = index
+    for a, b in pairs.values():
+        a.close()
+        b.close()
+    logging.info(f"Started {count} workers.")
+
+    def signalWorkers(signum, frame=None):
+        for pid in children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def stopWorkers(signum=None, frame=None):
+        signalWorkers(signal.SIGTERM)
+
+    # SIGINT from a terminal reaches the workers directly
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, stopWorkers)
+    # Profiling toggles and reports
+    signal.signal(signal.SIGUSR1, signalWorkers)
+    signal.signal(signal.SIGUSR2, signalWorkers)
+
+    exitCode = 0
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid)
+        if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0:
+            continue
+        # The mesh cannot be rebuilt for a replacement, so take the whole
+        # server down and let the service manager restart it
+        logging.error(f"Worker {index} exited unexpectedly, stopping the server.")
+        exitCode = 1
+        stopWorkers()
+    sys.exit(exitCode)
+
+
+class WorkerNode:
+    """One worker's view of the process group it belongs to."""
+
+    def __init__(self, index: int, count: int, peers: dict):
+        self.index = index
+        self.count = count
+        self._peerSockets = peers
+        self._links = {}
+        self._factory = None
+        self._handoffIds = itertools.count()
+        self._pendingHandoffs = {}
+        self._stopping = False
+        # Case-folded usernames each peer has in use, and how many peers use each
+        self._namesByPeer = {}
+        self.remoteNames = {}
+
+    def listen(self, factory, port: int) -> None:
+        from twisted.internet import reactor
+
+        self._factory = factory
+        factory.setWorkerNode(self)
+        for peer, skt in self._peerSockets.items():
+            skt.setblocking(False)
+            reactor.adoptStreamConnection(skt.fileno(), socket.AF_UNIX, WorkerLinkFactory(self, peer))
+            skt.close()
+        self._peerSockets = {}
+        reactor.addSystemEventTrigger("before", "shutdown", self._stopLinks)
+
+        for family, interface, name in ((socket.AF_INET6, "::", "IPv6"), (socket.AF_INET, "0.0.0.0", "IPv4")):
+            try:
+                skt = socket.socket(family, socket.SOCK_STREAM)
+                skt.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                skt.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+                if family == socket.AF_INET6:
+                    skt.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+                skt.bind((interface, port))
+                skt.listen(constants.LISTEN_BACKLOG)
+                skt.setblocking(False)
+                reactor.adoptStreamPort(skt.fileno(), family, factory)
+                skt.close()
+            except OSError as e:
+                logging.debug(e)
+                logging.error(f"{name} listening failed.")
+
+    def linkConnected(self, peer: int, link: 'WorkerLink') -> None:
+        self._links[peer] = link
+
+    def linkLost(self, peer: int, peerStopping: bool) -> None:
+        self._links.pop(peer, None)
+        for key in self._namesByPeer.pop(peer, ()):
+            self._forgetRemoteName(key)
+        if self._stopping or peerStopping:
+            logging.info(f"Closed connection to worker {peer}.")
+        else:
+            logging.error(f"Lost connection to worker {peer}.")
+
+    def _stopLinks(self):
+        # Tell the other workers this one is stopping, so they do not take
+        # the closed links for a crash, and give them a moment to hear it
+        from twisted.internet import reactor
+
+        self._stopping = True
+        stopped = defer.DeferredList([link.stop() for link in self._links.values()], consumeErrors=True)
+        stopped.addTimeout(constants.WORKER_STOP_TIMEOUT, reactor)
+        stopped.addErrback(lambda failure: None)
+        return stopped
+
+    def routeRoom(self, roomName: str):
+        # The link to the worker owning roomName, or None to keep it here
+        roomName = truncateText(roomName, constants.MAX_ROOM_NAME_LENGTH)
+        owner = roomOwner(roomName, self.count)
+        if owner == self.index:
+            return None
+        return self._links.get(owner)
+
+    def claimName(self, username: str) -> None:
+        for link in self._links.values():
+            link.sendNameClaimed(username)
+
+    def releaseName(self, username: str) -> None:
+        for link in self._links.values():
+            link.sendNameReleased(username)
+
+    def nameClaimed(self, peer: int, username: str) -> None:
+        key = username.lower()
+        names = self._namesByPeer.setdefault(peer, set())
+        if key not in names:
+            names.add(key)
+            self.remoteNames[key] = self.remoteNames.get(key, 0) + 1
+
+    def nameReleased(self, peer: int, username: str) -> None:
+        key = username.lower()
+        names = self._namesByPeer.get(peer)
+        if names is not None and key in names:
+            names.remove(key)
+            self._forgetRemoteName(key)
+
+    def _forgetRemoteName(self, key: str) -> None:
+        remaining = self.remoteNames[key] - 1
+        if remaining:
+            self.remoteNames[key] = remaining
+        else:
+            del self.remoteNames[key]
+
+    def handOff(self, protocol, link: 'WorkerLink', resume: dict, unhandled: bytes = b"") -> None:
+        # unhandled holds commands the client sent that this worker did not
+        # get to; the owner handles them before anything else
+        from twisted.internet import reactor
+
+        transport = protocol.transport
+        resume["host"] = protocol.getPeerHost()
+        protocol.flush(force=True)
+        if resume.get("switch"):
+            # The name moves with the client: count it as the owner's until
+            # the owner confirms it took over and claimed it itself
+            self.nameClaimed(link.peer, resume["username"])
+        if getattr(transport, "TLS", False):
+            # TLS state cannot move between processes: keep terminating it
+            # here and relay the plaintext to the owner over a socket pair
+            local, remote = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+            local.setblocking(False)
+            remote.setblocking(False)
+            self._sendHandoff(link, remote.fileno(), socket.AF_UNIX, resume, unhandled)
+            remote.close()
+            reactor.adoptStreamConnection(local.fileno(), socket.AF_UNIX, RelayFactory(protocol))
+            local.close()
+        else:
+            pending = unhandled + protocol.clearLineBuffer()
+            self._sendHandoff(link, transport.fileno(), transport.socket.family, resume, pending)
+            # Close our copy without shutting down the socket the owner now uses
+            transport._shouldShutdown = False
+            transport.loseConnection()
+
+    def _sendHandoff(self, link: 'WorkerLink', fd: int, family: int, resume: dict, pending: bytes) -> None:
+        handoffId = next(self._handoffIds)
+        # Keep a duplicate open until the owner confirms it adopted the socket
+        duplicate = os.dup(fd)
+        self._pendingHandoffs[handoffId] = (duplicate, resume["username"] if resume.get("switch") else None)
+        link.sendHandoff(duplicate, {
+            "id": handoffId,
+            "family": family,
+            "resume": resume,
+            "pending": base64.b64encode(pending).decode('ascii'),
+        })
+
+    def handoffDone(self, handoffId: int) -> None:
+        # The owner has claimed the name of a client that switched rooms by
+        # now, so the other workers may forget it was in use here
+        duplicate, username = self._pendingHandoffs.pop(handoffId, (None, None))
+        if duplicate is not None:
+            os.close(duplicate)
+        if username is not None:
+            self.releaseName(username)
+
+    def adopt(self, fd: int, handoff: dict, peer: int) -> None:
+        from twisted.internet import reactor
+
+        resume = handoff["resume"]
+        if resume.get("switch"):
+            # The client brings its name along from the worker it leaves
+            self.nameReleased(peer, resume["username"])
+        factory = AdoptingFactory(self._factory)
+        try:
+            reactor.adoptStreamConnection(fd, handoff["family"], factory)
+        except Exception:
+            logging.exception("Could not adopt a connection handed off by another worker.")
+            factory.protocol = None
+        finally:
+            os.close(fd)
+        protocol = factory.protocol
+        if protocol is None:
+            if resume.get("switch"):
+                self.releaseName(resume["username"])
+            return
+        protocol.resumeHandoff(resume)
+        pending = base64.b64decode(handoff["pending"])
+        if pending:
+            protocol.dataReceived(pending)
+
+    def publish(self, line: bytes) -> None:
+        for link in self._links.values():
+            link.sendBroadcast(line)
+
+    def deliver(self, line: bytes) -> None:
+        self._factory.deliverRemoteBroadcast(line)
+
+    def gatherRosters(self) -> defer.Deferred:
+        # The List fragments of every room on the other workers; those that
+        # do not answer within WORKER_LIST_TIMEOUT are left out
+        requests = [link.requestRosters() for link in self._links.values()]
+        gathering = defer.gatherResults(requests)
+        gathering.addCallback(lambda replies: [roster for rosters in replies for roster in rosters])
+        return gathering
+
+    def encodeRosters(self) -> list:
+        return self._factory.encodeRosters()
+
+
+@implementer(IFileDescriptorReceiver)
+class WorkerLink(LineReceiver):
+    # List replies carry every room of a worker
+    MAX_LENGTH = 64 * 1024 * 1024
+
+    def __init__(self, node: WorkerNode, peer: int):
+        self._node = node
+        self.peer = peer
+        self._receivedFds = []
+        self._peerStopping = False
+        self._closed = defer.Deferred()
+        self._requestIds = itertools.count()
+        self._rosterRequests = {}
+
+    def connectionMade(self) -> None:
+        self._node.linkConnected(self.peer, self)
+
+    def connectionLost(self, reason) -> None:
+        for fd in self._receivedFds:
+            os.close(fd)
+        requests, self._rosterRequests = self._rosterRequests, {}
+        for request in requests.values():
+            request.callback([])
+        self._node.linkLost(self.peer, self._peerStopping)
+        self._closed.callback(None)
+
+    def stop(self) -> defer.Deferred:
+        # Fires once the peer has read the frame and closed the link. Only
+        # our side is shut down, so the peer's writes in the meantime do not
+        # fail before it gets to read why the link is going away.
+        self._sendFrame({"Stopping": True})
+        self.transport.loseWriteConnection()
+        return self._closed
+
+    def fileDescriptorReceived(self, fd: int) -> None:
+        # Descriptors arrive no later than the frame they belong to
+        self._receivedFds.append(fd)
+
+    def lineReceived(self, line: bytes) -> None:
+        frame = json.loads(line)
+        if "Broadcast" in frame:
+            self._node.deliver(frame["Broadcast"].encode('utf-8'))
+        elif "Handoff" in frame:
+            handoff = frame["Handoff"]
+            self._node.adopt(self._receivedFds.pop(0), handoff, self.peer)
+            self._sendFrame({"HandoffDone": handoff["id"]})
+        elif "HandoffDone" in frame:
+            self._node.handoffDone(frame["HandoffDone"])
+        elif "NameClaimed" in frame:
+            self._node.nameClaimed(self.peer, frame["NameClaimed"])
+        elif "NameReleased" in frame:
+            self._node.nameReleased(self.peer, frame["NameReleased"])
+        elif "ListRequest" in frame:
+            rosters = [roster.decode('utf-8') for roster in self._node.encodeRosters()]
+            self._sendFrame({"ListReply": {"id": frame["ListRequest"], "rosters": rosters}})
+        elif "ListReply" in frame:
+            reply = frame["ListReply"]
+            request = self._rosterRequests.pop(reply["id"], None)
+            if request is not None:
+                request.callback([roster.encode('utf-8') for roster in reply["rosters"]])
+        elif "Stopping" in frame:
+            self._peerStopping = True
+
+    def _sendFrame(self, frame: dict) -> None:
+        self.sendLine(json.dumps(frame).encode('utf-8'))
+
+    def sendHandoff(self, fd: int, handoff: dict) -> None:
+        self.transport.sendFileDescriptor(fd)
+        self._sendFrame({"Handoff": handoff})
+
+    def sendBroadcast(self, line: bytes) -> None:
+        self._sendFrame({"Broadcast": line.decode('utf-8')})
+
+    def sendNameClaimed(self, username: str) -> None:
+        self._sendFrame({"NameClaimed": username})
+
+    def sendNameReleased(self, username: str) -> None:
+        self._sendFrame({"NameReleased": username})
+
+    def requestRosters(self) -> defer.Deferred:
+        from twisted.internet import reactor
+
+        requestId = next(self._requestIds)
+        request = defer.Deferred(lambda _: self._rosterRequests.pop(requestId, None))
+        self._rosterRequests[requestId] = request
+        self._sendFrame({"ListRequest": requestId})
+        request.addTimeout(constants.WORKER_LIST_TIMEOUT, reactor)
+        request.addErrback(self._rostersTimedOut)
+        return request
+
+    def _rostersTimedOut(self, failure) -> list:
+        failure.trap(defer.TimeoutError)
+        logging.warning(f"Worker {self.peer} did not answer a List request in time.")
+        return []
+
+
+class WorkerLinkFactory(Factory):
+    def __init__(self, node: WorkerNode, peer: int):
+        self._node = node
+        self._peer = peer
+
+    def buildProtocol(self, addr):
+        return WorkerLink(self._node, self._peer)
+
+
+class AdoptingFactory(ServerFactory):
+    # Remembers the protocol built for a single adopted connection
+    def __init__(self, factory):
+        self._factory = factory
+        self.protocol = None
+
+    def buildProtocol(self, addr):
+        self.protocol = self._factory.buildAdoptedProtocol(addr)
+        return self.protocol
+
+
+class RelayLink(Protocol):
+    # Carries plaintext between a TLS client and the worker owning its room
+    def __init__(self, client):
+        self._client = client
+
+    def connectionMade(self) -> None:
+        self._client.startRelay(self.transport)
+
+    def dataReceived(self, data: bytes) -> None:
+        self._client.transport.write(data)
+
+    def connectionLost(self, reason) -> None:
+        self._client.drop()
+
+
+class RelayFactory(Factory):
+    def __init__(self, client):
+        self._client = client
+
+    def buildProtocol(self, addr):
+        return RelayLink(self._client)